@@ -12,7 +12,7 @@ Y = np.array([y]).T         # Convert y data to column vector Y
 
 # Logistic Regression Model
 logistic_reg = LogisticRegressionModel(1) # Create Logistic Regression Model with 1 input argument
-logistic_reg.fit(X, Y, 10000, 0.1) # Train Model by data
+logistic_reg.fit(X, Y, solver='newton') # Train Model by data (Newton's method)
 theta0, theta1 = logistic_reg.weights # Get the weights
 y_p = logistic_reg.predict(X)
 
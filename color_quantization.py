@@ -1,67 +1,171 @@
-﻿import sys
+﻿import argparse
+import glob
+import os
 import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from PIL import Image
 import numpy as np
-from sklearn.cluster import KMeans as SKKMeans
+from models.k_means import KMeans
 
 
 """
-Color-Quantization of image by K-Means algorithm
-Command line argument:
-    origin image path.
+Color-Quantization of images by K-Means algorithm
+Command line arguments:
+    images: image path, directory or glob pattern (e.g. "photos/*.jpg").
     Num of colors or 'bw' for black and white image.
-The result image will be save in the origin folder.
+    --jobs: num of worker processes.
+    --samples: num of pixels of every image the model is fitted on.
+    --tile-rows: num of image rows remapped at once.
+The result images will be saved in the origin folders.
 """
 
 
-# Upload the cmd argument to variabels
-assert len(sys.argv) == 3
-img_path = sys.argv[1]
-n_colors = sys.argv[2]
-bw = False
-
-if n_colors == 'bw':    # Black and white option
-    n_colors = 2
-    bw = True
-
-assert 0 < int(n_colors) < 256
-
-
-# Upload the image and convert it to numpy array
-img = Image.open(img_path)
-img = np.array(img)
-w, h, d = img.shape
-X = img.reshape((w*h, d))
-print(f"Succefly uploaded image from: \"{img_path}\"")
-
-
-# Initialize K-Means model and cauterize the data
-model = SKKMeans(int(n_colors), "random", 1, 100)
-model.fit(X)
-labels = model.labels_
-print("Succefly created and fit K-Means model")
-
-
-# Cluster centers
-if bw:
-    centers = np.array([[0, 0, 0], [255, 255, 255]])
-else:
-    centers = model.cluster_centers_
-
-
-# Build new image
-new_img = []
-for label in labels:
-    new_img.append(centers[int(label)])
-
-new_img = np.array(new_img)
-new_img = new_img.reshape((w, h, d))
-new_img = Image.fromarray(new_img.astype(np.uint8))
-
-
-# Save the new image
-pattern = r"\.[\w]+$"
-form = re.search(pattern, img_path).group()
-new_img_path = re.sub(pattern, "-new"+form, img_path)
-new_img.save(new_img_path)
-print(f"Succefly created new image at: \"{new_img_path}\"")
+LUT_BITS = 6    # Bits per channel of the palette lookup table
+LUT_SIZE = 18   # Max bits of the lookup table index (256K entries)
+IMAGE_MODES = ('L', 'LA', 'RGB', 'RGBA')  # Remapped as they are, others are converted
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tif', '.tiff', '.webp')
+
+
+def build_palette_lut(centers, bits=LUT_BITS, palette=None):
+    """
+    Build a lookup table from every color to its closest cluster center.
+    The color space is reduced to 'bits' bits per channel, so the table has
+    2^(bits*d) entries (256K for RGB with 6 bits), each holding the palette
+    color of the center closest to the middle of its cell.
+    Arguments:
+        centers (np.ndarray): Cluster centers, one per row.
+        bits (int): Bits per channel (8 - exact mapping of every color).
+        palette (np.ndarray): Color of every center (default - the centers).
+    """
+    n_colors, d = centers.shape
+    if palette is None:
+        palette = centers
+    palette = np.clip(np.rint(palette), 0, 255).astype(np.uint8)
+
+    # Middle color of every cell of the reduced color space
+    levels = (np.arange(2**bits) << (8 - bits)) + ((1 << (8 - bits)) >> 1)
+    grid = np.stack(np.meshgrid(*[levels] * d, indexing='ij'), axis=-1).reshape(-1, d)
+
+    model = KMeans(n_colors, d)
+    model.cluster_centers = np.asarray(centers, dtype=float)
+    labels = model.predict(grid, chunk_size=2**16).ravel()
+    return palette[labels]
+
+
+def apply_palette(img, lut, bits=LUT_BITS):
+    """
+    Map every pixel of the uint8 image img (w, h, d) to its palette color by
+    a single gather from the lookup table of build_palette_lut.
+    """
+    img = np.asarray(img, dtype=np.uint8)
+    shift = 8 - bits
+    index = np.zeros(img.shape[:-1], dtype=np.intp)
+    for channel in range(img.shape[-1]):
+        index <<= bits
+        index |= img[..., channel] >> shift
+    return lut[index]
+
+
+def find_images(paths):
+    """Return the image files of the given paths, directories and glob patterns"""
+    images = []
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(os.path.join(path, name) for name in os.listdir(path))
+        else:
+            files = sorted(glob.glob(path)) or [path]
+        images += [f for f in files if f.lower().endswith(IMAGE_EXTENSIONS)
+                   and not os.path.splitext(f)[0].endswith('-new')]
+    return images
+
+
+def quantize_image(img_path, n_colors, n_samples=100000, tile_rows=1024, random_state=None):
+    """
+    Color-Quantization of the image at img_path to n_colors colors
+    ('bw' for black and white). The model is fitted on n_samples random
+    pixels and the image is remapped tile_rows rows at a time, in place.
+    random_state (int) seeds the sampling and the model (None - random).
+    Returns the path of the new image.
+    """
+    bw = n_colors == 'bw'
+    n_colors = 2 if bw else int(n_colors)
+    assert 0 < n_colors < 256
+
+    # Upload the image and convert it to numpy array of 8-bit channels
+    image = Image.open(img_path)
+    if image.mode.startswith('I;16'):
+        # 16-bit grayscale, which convert would clip instead of scaling
+        image = Image.fromarray((np.array(image) >> 8).astype(np.uint8))
+    elif image.mode not in IMAGE_MODES:
+        # e.g. palette (P) images
+        transparent = 'transparency' in image.info or image.mode.endswith(('A', 'a'))
+        image = image.convert('RGBA' if transparent else 'RGB')
+    img = np.array(image)
+    gray = img.ndim == 2
+    if gray:
+        img = img[..., None]
+    w, h, d = img.shape
+    X = img.reshape((w*h, d))
+
+    # Fit K-Means model on a subsample of the pixels (unique colors only)
+    # The Generator draws without permuting all the w*h indices
+    rng = np.random.default_rng(random_state)
+    sample = X[rng.choice(w*h, min(n_samples, w*h), replace=False)]
+    model = KMeans(n_colors, d)
+    model.fit(sample, 100, 1, collapse_duplicates=True, random_state=random_state)
+
+    # Palette colors of the cluster centers
+    palette = np.array([[0] * d, [255] * d]) if bw else None
+    # Exact 8-bit table for grayscale, LUT_BITS per channel for colors
+    bits = min(8 if d < 3 else LUT_BITS, LUT_SIZE // d)
+    lut = build_palette_lut(model.cluster_centers, bits, palette)
+
+    # Remap the image tile by tile, so memory stays bounded for huge images
+    for start in range(0, w, tile_rows):
+        img[start:start + tile_rows] = apply_palette(img[start:start + tile_rows], lut, bits)
+    new_img = Image.fromarray(img[..., 0] if gray else img)
+
+    # Save the new image
+    pattern = r"\.[\w]+$"
+    form = re.search(pattern, img_path).group()
+    new_img_path = re.sub(pattern, "-new"+form, img_path)
+    new_img.save(new_img_path)
+    return new_img_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Color-Quantization of images by K-Means")
+    parser.add_argument('images', nargs='+', help="image paths, directories or glob patterns")
+    parser.add_argument('n_colors', help="num of colors or 'bw' for black and white")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+                        help="num of worker processes")
+    parser.add_argument('--samples', type=int, default=100000,
+                        help="num of pixels of every image the model is fitted on")
+    parser.add_argument('--tile-rows', type=int, default=1024,
+                        help="num of image rows remapped at once")
+    args = parser.parse_args()
+
+    images = find_images(args.images)
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = {executor.submit(quantize_image, path, args.n_colors, args.samples,
+                                   args.tile_rows): path for path in images}
+        n_quantized = 0
+        for future in as_completed(futures):
+            # A bad image is reported without stopping the rest of the batch
+            try:
+                new_img_path = future.result()
+            except Exception as error:
+                print(f"Failed to quantize \"{futures[future]}\": {error}")
+                continue
+            n_quantized += 1
+            print(f"Created \"{new_img_path}\" from \"{futures[future]}\"")
+
+    elapsed = time.time() - start
+    print(f"Quantized {n_quantized} of {len(images)} images in {elapsed:.2f}s "
+          f"({n_quantized / elapsed:.2f} images/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,24 +1,19 @@
 ﻿import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-from datetime import datetime
 from models.linear_model import LinearRegressionModel
+from models.feature_transform import PolynomialFeatures, FeaturePipeline, dates_to_years
 from datasets import import_dataset, DATASETS
 
 
 DATASET_NAME = "house prices uk"
 DATES = ['Date']
 PRICES = ['Price (All)', 'Price (New)', 'Price (Modern)', 'Price (Older)']
-INPUT_FEATURES = 2
+DEGREE = 2
+INPUT_FEATURES = DEGREE  # date, date^2, ... date^DEGREE
 OUTPUT_FEATURES = 4
 
 
-def date2years(date):
-    """Convert date str to float number of years"""
-    date = datetime.strptime(date, '%Y-%m-%d')
-    return date.year + (date.month - 1)/12
-
-
 # Import the dates and prices data from 'hose_prices_data.csv' file
 import_dataset(DATASET_NAME)
 data = pd.read_csv(DATASETS[DATASET_NAME]['path'], index_col=0,
@@ -28,17 +23,17 @@ data = pd.read_csv(DATASETS[DATASET_NAME]['path'], index_col=0,
 data = data[data > 0]
 data = data.dropna()
 
-# Create datasets X and Y (D2 - polynomial dataset)
-x = [date2years(date) for date in data.index]
-X2 = np.array([[date, date**2] for date in x])
+# Create datasets x and Y (the features of x are expanded to a polynomial of DEGREE)
+x = dates_to_years(data.index)
 Y = data.loc[:, PRICES].to_numpy()
 
 # Create LinearRegression model and training by given data
-linear_reg = LinearRegressionModel(INPUT_FEATURES, OUTPUT_FEATURES, True)
-linear_reg.fit(X2, Y)
+linear_reg = FeaturePipeline(PolynomialFeatures(DEGREE),
+                             LinearRegressionModel(INPUT_FEATURES, OUTPUT_FEATURES, True))
+linear_reg.fit(x, Y)
 
-# Predict the dataset X by our model
-Y_predict = linear_reg.predict(X2)
+# Predict the dataset x by our model
+Y_predict = linear_reg.predict(x)
 prediction = pd.DataFrame(Y_predict, index=data.index, columns=PRICES)
 
 # Plot the prices and the pur prediction
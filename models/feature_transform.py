@@ -0,0 +1,110 @@
+from .model_base import Model
+from functools import lru_cache
+from itertools import combinations, combinations_with_replacement
+import numpy as np
+
+
+def dates_to_years(dates):
+    """
+    Convert dates (ISO strings 'YYYY-MM-DD', datetime objects or
+    np.datetime64) to float numbers of years, year + (month - 1) / 12, all
+    at once.
+    """
+    months = np.asarray(dates, dtype='datetime64[D]').astype('datetime64[M]')
+    # Months since 1970-01
+    return 1970 + months.astype(np.int64) / 12
+
+
+@lru_cache(maxsize=None)
+def monomial_plan(n_features, degree, interaction_only=False):
+    """
+    The plan of the polynomial expansion of n_features features: the
+    monomials of every degree 2 .. degree follow the features, and every
+    monomial is the product of a monomial of the previous degree (its
+    parent column) and one feature.
+    Returns (the parent columns, the features) of every column from
+    n_features on. Cached, so the plan is built once per shape.
+    """
+    monomials = {(feature,): feature for feature in range(n_features)}
+    parents, features = [], []
+    terms = combinations if interaction_only else combinations_with_replacement
+    for current_degree in range(2, degree + 1):
+        for monomial in terms(range(n_features), current_degree):
+            parents.append(monomials[monomial[:-1]])
+            features.append(monomial[-1])
+            monomials[monomial] = len(monomials)
+    return tuple(parents), tuple(features)
+
+
+class PolynomialFeatures:
+    """
+    Polynomial (and interaction) expansion of the features, by the order of
+    sklearn's PolynomialFeatures without the bias column (the models add
+    it): the features, then all the monomials of degree 2, 3, ... degree.
+    Arguments:
+        degree (int): Max degree of the monomials.
+        interaction_only (bool): Only products of distinct features.
+    """
+
+    def __init__(self, degree=2, interaction_only=False):
+        if degree < 1:
+            raise ValueError(f'The degree must be at least 1, got {degree}.')
+        self.degree = degree
+        self.interaction_only = interaction_only
+
+    def n_output_features(self, n_features):
+        """Num of the columns of the expansion of n_features features"""
+        parents, _ = monomial_plan(n_features, self.degree, self.interaction_only)
+        return n_features + len(parents)
+
+    def transform(self, X, out=None):
+        """
+        Take dataset X (N x n_features, or N of one feature) and return its
+        expansion (N x n_output_features) into out (a new column-major array
+        if None). Every column is one vectorized product of its parent
+        column and a feature, without temporaries.
+        """
+        X = np.asarray(X)
+        X = X.astype(np.result_type(X, np.float64) if out is None else out.dtype, copy=False)
+        # Column-major, so every column is contiguous
+        X = np.asfortranarray(X.reshape(X.shape[0], -1))
+        n_features = X.shape[1]
+        parents, features = monomial_plan(n_features, self.degree, self.interaction_only)
+        if out is None:
+            out = np.empty((X.shape[0], n_features + len(parents)), dtype=X.dtype, order='F')
+
+        out[:, :n_features] = X
+        for column, (parent, feature) in enumerate(zip(parents, features), n_features):
+            np.multiply(out[:, parent], X[:, feature], out=out[:, column])
+        return out
+
+
+class FeaturePipeline(Model):
+    """
+    A model on transformed features: fit, partial_fit and predict transform
+    X (e.g. by PolynomialFeatures) and pass it with the rest of the
+    arguments to the model.
+    Arguments:
+        transform: Feature transform with a transform(X) method.
+        model (Model): e.g. LinearRegressionModel with input_features of
+            the transformed features.
+    """
+
+    def __init__(self, transform, model):
+        self.transform = transform
+        self.model = model
+
+    def extra_repr(self):
+        return repr(self.model)
+
+    def fit(self, X, y, *args, **kwargs):
+        return self.model.fit(self.transform.transform(X), y, *args, **kwargs)
+
+    def partial_fit(self, X, y, *args, **kwargs):
+        return self.model.partial_fit(self.transform.transform(X), y, *args, **kwargs)
+
+    def predict(self, X, *args, **kwargs):
+        return self.model.predict(self.transform.transform(X), *args, **kwargs)
+
+    def loss(self, y_prediction, y_true):
+        return self.model.loss(y_prediction, y_true)
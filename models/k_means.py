@@ -1,6 +1,96 @@
 ﻿from .model_base import Model
+from .shared_arrays import share_arrays, shared_run
+from concurrent.futures import ProcessPoolExecutor
+import os
+from time import perf_counter
 import numpy as np
-from random import choices
+from scipy.spatial import cKDTree
+
+
+def row_chunks(n_samples, chunk_size=None):
+    """Yield (start, stop) bounds of consecutive row blocks of size chunk_size"""
+    chunk_size = chunk_size or max(n_samples, 1)
+    for start in range(0, n_samples, chunk_size):
+        yield start, min(start + chunk_size, n_samples)
+
+
+def iter_batches(X, batch_size, shuffle=True):
+    """
+    Yield mini-batches of batch_size samples of the dataset X.
+    shuffle (bool): Draw the samples in a random order. Without shuffling
+        the batches are contiguous slices, so a np.memmap is read sequentially.
+    """
+    if not shuffle:
+        for start, stop in row_chunks(X.shape[0], batch_size):
+            yield X[start:stop]
+        return
+
+    order = np.random.permutation(X.shape[0])
+    for start, stop in row_chunks(X.shape[0], batch_size):
+        yield X[np.sort(order[start:stop])]
+
+
+def squared_norms(X, chunk_size=None, dtype=np.float64):
+    """Return the squared L2 norm of every row of X (computed in dtype)"""
+    norms = np.empty(X.shape[0], dtype=dtype)
+    for start, stop in row_chunks(X.shape[0], chunk_size):
+        block = np.asarray(X[start:stop], dtype=dtype)
+        norms[start:stop] = np.einsum('ij,ij->i', block, block)
+    return norms
+
+
+def squared_distances(X, centers, x_squared_norms=None, chunk_size=None):
+    """
+    Return the matrix of squared distances between the samples of X and the
+    centers, computed in the dtype of the centers.
+    """
+    dtype = centers.dtype
+    if x_squared_norms is None:
+        x_squared_norms = squared_norms(X, chunk_size, dtype)
+
+    distances = np.empty((X.shape[0], centers.shape[0]), dtype=dtype)
+    centers_squared_norms = squared_norms(centers, dtype=dtype)
+    for start, stop in row_chunks(X.shape[0], chunk_size):
+        block = distances[start:stop]
+        np.matmul(np.asarray(X[start:stop], dtype=dtype), centers.T, out=block)
+        block *= -2
+        block += centers_squared_norms
+        block += x_squared_norms[start:stop, None]
+    return np.maximum(distances, 0, out=distances)
+
+
+def unique_rows(X, sample_weight=None):
+    """
+    Collapse the duplicate rows of X.
+    Returns the unique rows and the total weight of each of them (the num of
+    its duplicates if sample_weight isn't given).
+    """
+    X = np.asarray(X)
+    n_features = X.shape[1]
+    if X.dtype == np.uint8 and n_features <= 8:
+        # Pack every row (e.g. an RGB pixel) to one integer, much faster to sort.
+        # The first feature is the most significant byte, so the order is
+        # lexicographic like np.unique
+        shifts = np.arange(8 * (n_features - 1), -1, -8).astype(np.uint64)
+        keys = np.zeros(X.shape[0], dtype=np.uint64)
+        for j in range(n_features):
+            keys |= X[:, j].astype(np.uint64) << shifts[j]
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        unique = ((unique_keys[:, None] >> shifts) & 0xFF).astype(np.uint8)
+    else:
+        unique, inverse = np.unique(X, axis=0, return_inverse=True)
+
+    weights = np.bincount(inverse.ravel(), weights=sample_weight, minlength=len(unique))
+    return unique, weights
+
+
+def restart_run(X, sample_weight, model_args, seed, run_args):
+    """
+    Run one K-Means restart of a KMeans(*model_args) (e.g. in a worker
+    process of parallel_runs). run_args are the keyword arguments of
+    single_run.
+    """
+    return KMeans(*model_args).single_run(X, seed, sample_weight=sample_weight, **run_args)
 
 
 class KMeans(Model):
@@ -9,18 +99,109 @@ class KMeans(Model):
     Arguments:
         n_clusters (int): Num of clusters (K).
         n_features (int): Num of the features.
+        dtype (np.dtype): Floating type of the computations and the cluster
+            centers. np.float32 halves the memory traffic of the iterations.
     """
 
-    def __init__(self, n_clusters, n_features):
+    def __init__(self, n_clusters, n_features, dtype=np.float64):
         self.n_clusters = n_clusters
         self.n_features = n_features
-        self.cluster_centers = np.zeros((n_clusters, n_features))
+        self.dtype = np.dtype(dtype)
+        self.cluster_centers = np.zeros((n_clusters, n_features), dtype=self.dtype)
+        # Num of samples seen by every cluster (None - the model wasn't trained)
+        self.counts = None
+        # Loss and num of iterations of the last training
+        self.inertia = None
+        self.iterations = 0
+        # Runs and iterations of the last training (see fit)
+        self.history = None
+        # Nearest-center index of predict (None - brute force scan of the centers)
+        self.index = None
+
+    def init_centers(self, X, init='k-means++', x_squared_norms=None, chunk_size=None,
+                     sample_weight=None, random_state=None):
+        """
+        Initialization of cluster centers by the init method:
+            'random' - random distinct samples of X.
+            'k-means++' - k-means++ seeding.
+            'greedy-k-means++' - k-means++ seeding that keeps the best of
+                2 + log(K) candidates for every center.
+        The samples are drawn in proportion to sample_weight if it's given,
+        by random_state (np.random.RandomState, None - np.random).
+        """
+        if init == 'random':
+            return self.random_init(X, sample_weight, random_state)
+        if init == 'k-means++':
+            return self.kmeans_plus_plus_init(X, 1, x_squared_norms, chunk_size, sample_weight,
+                                              random_state)
+        if init == 'greedy-k-means++':
+            n_trials = 2 + int(np.log(self.n_clusters))
+            return self.kmeans_plus_plus_init(X, n_trials, x_squared_norms, chunk_size,
+                                              sample_weight, random_state)
+        raise ValueError(f"Unknown init method '{init}'.")
 
-    def random_init(self, X):
+    def random_init(self, X, sample_weight=None, random_state=None):
         """Random initialization of cluster centers"""
-        return np.array(choices(X, k=self.n_clusters))
+        random_state = np.random if random_state is None else random_state
+        # Draw without replacement (unless there are less samples than clusters)
+        if sample_weight is None:
+            probabilities, n_candidates = None, X.shape[0]
+        else:
+            probabilities = sample_weight / sample_weight.sum()
+            n_candidates = np.count_nonzero(probabilities)
+        indices = random_state.choice(X.shape[0], self.n_clusters, p=probabilities,
+                                      replace=n_candidates < self.n_clusters)
+        return np.array(X[np.sort(indices)], dtype=self.dtype)
+
+    def kmeans_plus_plus_init(self, X, n_trials=1, x_squared_norms=None, chunk_size=None,
+                              sample_weight=None, random_state=None):
+        """
+        k-means++ initialization of cluster centers.
+        Every new center is a sample drawn with probability proportional to its
+        (weighted) squared distance from the closest center that was already
+        chosen. With n_trials > 1 (greedy k-means++) n_trials candidates are
+        drawn and the one that reduces the loss the most is kept.
+        """
+        random_state = np.random if random_state is None else random_state
+        n_samples = X.shape[0]
+        if x_squared_norms is None:
+            x_squared_norms = squared_norms(X, chunk_size, self.dtype)
+
+        centers = np.empty((self.n_clusters, X.shape[1]), dtype=self.dtype)
+        if sample_weight is None:
+            centers[0] = X[random_state.randint(n_samples)]
+        else:
+            centers[0] = X[random_state.choice(n_samples, p=sample_weight / sample_weight.sum())]
+        closest_distances = squared_distances(
+            X, centers[:1], x_squared_norms, chunk_size).ravel()
+
+        for k in range(1, self.n_clusters):
+            # Draw candidates with probability proportional to the distance
+            if sample_weight is None:
+                cumulative = np.cumsum(closest_distances)
+            else:
+                cumulative = np.cumsum(closest_distances * sample_weight)
+            candidates = np.searchsorted(
+                cumulative, random_state.rand(n_trials) * cumulative[-1])
+            candidates = np.minimum(candidates, n_samples - 1)
 
-    def fit(self, X, n_iter, n_init, init_cluster_centers=None):
+            # Keep the candidate that minimizes the loss
+            distances = squared_distances(
+                X, np.asarray(X[candidates], dtype=self.dtype), x_squared_norms, chunk_size)
+            np.minimum(distances, closest_distances[:, None], out=distances)
+            if sample_weight is None:
+                best = np.argmin(distances.sum(axis=0))
+            else:
+                best = np.argmin(sample_weight @ distances)
+
+            centers[k] = X[candidates[best]]
+            closest_distances = distances[:, best]
+
+        return centers
+
+    def fit(self, X, n_iter, n_init, init_cluster_centers=None, chunk_size=None,
+            init='k-means++', tol=0, algorithm='lloyd', n_jobs=1, random_state=None,
+            sample_weight=None, collapse_duplicates=False, build_index=False, history=False):
         """
         Training the model by dataset X.
         Arguments:
@@ -28,73 +209,487 @@ class KMeans(Model):
             n_iter (int): Num of iteration.
             n_init (int): Num of algorithm iteration to avoid local minimum.
             init_cluster_centers (np.ndarray): Initial values of cluster_centers.
+            chunk_size (int): Num of samples assigned at once. The distance
+                matrix is only built for chunk_size x n_clusters, so the
+                memory of the fit is bounded for large datasets.
+                None - assign the whole dataset at once.
+            init (str): Initialization method of the cluster centers when
+                init_cluster_centers isn't given: 'random', 'k-means++' or
+                'greedy-k-means++'.
+            tol (float): Stop a run once the total squared shift of the
+                cluster centers is at most tol. A run always stops when
+                the labels don't change anymore.
+            algorithm (str): Assignment step of the iterations:
+                'lloyd' - distances from every sample to every center.
+                'hamerly' - keeps an upper bound on the distance of every
+                    sample to its center and a lower bound on the distance
+                    to the second closest one, and skips the samples that
+                    provably keep their label. Same result as 'lloyd', much
+                    less distance computations for large n_clusters.
+            n_jobs (int): Num of worker processes for the n_init runs
+                (-1 - all the cores). The workers read X from shared memory.
+            random_state (int): Seed of the runs. Every run gets its own seed
+                derived from it, so the result doesn't depend on n_jobs.
+                None - derive the seeds from np.random.
+            sample_weight (np.ndarray): Weight of every sample (None - all 1).
+                The loss and the centers are weighted sums over the samples.
+            collapse_duplicates (bool): Cluster the unique rows of X weighted
+                by their num of duplicates. Same loss function, but the
+                iterations cost O(unique rows) instead of O(samples), e.g.
+                for the colors of an image.
+            build_index (bool): Build a KD-tree over the final cluster centers
+                that predict uses instead of scanning all of them.
+            history (bool): Record the history of the runs in self.history,
+                a list with a dict for every run:
+                    'seed', 'inertia', 'iterations' - as in single_run.
+                    'chosen' - True for the run with the lowest loss.
+                    'init_time', 'time' - seconds of the initialization
+                        and of the whole run.
+                    'steps' - a dict for every iteration with the loss of
+                        its assignment ('inertia', an upper bound with
+                        'hamerly'), 'label_changes', 'empty_clusters' that
+                        were reseeded, the total squared 'shift' of the
+                        centers, 'assign_time' and 'update_time'.
+                Recording only adds a few timer calls to every iteration.
+        After training, self.inertia is the loss of the chosen run and
+        self.iterations is the num of iterations it did.
         """
+        # The index of the old centers (the runs may train other instances in workers)
+        self.index = None
+
         # Initialize loss value end final cluster_centers matrix
         loss = float("inf")
-        best_cluster_centers = np.zeros((self.n_clusters, self.n_features))
+        best_cluster_centers = np.zeros((self.n_clusters, self.n_features), dtype=self.dtype)
+        best_counts = np.zeros(self.n_clusters)
+        best_iterations = 0
+
+        if sample_weight is not None:
+            sample_weight = np.asarray(sample_weight, dtype=float)
+        if collapse_duplicates:
+            X, sample_weight = unique_rows(X, sample_weight)
+
+        # Independent seed for every run
+        if random_state is None:
+            random_state = np.random.randint(2**32)
+        seeds = [int(seq.generate_state(1)[0])
+                 for seq in np.random.SeedSequence(random_state).spawn(n_init)]
 
         # Run k_means algorithm n_init times (to avoid local minimum) and save the best result
-        for _ in range(n_init):
-            self.k_means(X, n_iter, init_cluster_centers)
-            temp_cc = self.cluster_centers
-            if self.loss(X, self.predict(X)) < loss:
-                best_cluster_centers = temp_cc
+        run_args = dict(n_iter=n_iter, init_cluster_centers=init_cluster_centers,
+                        chunk_size=chunk_size, init=init, tol=tol, algorithm=algorithm,
+                        history=history)
+        if n_jobs == 1 or n_init == 1:
+            runs = (self.single_run(X, seed, sample_weight=sample_weight, **run_args)
+                    for seed in seeds)
+        else:
+            runs = self.parallel_runs(X, seeds, run_args, n_jobs, sample_weight)
+
+        self.history = [] if history else None
+        for inertia, temp_cc, counts, iterations, run_history in runs:
+            if history:
+                run_history['chosen'] = bool(inertia < loss)
+                self.history.append(run_history)
+            if inertia < loss:
+                loss = inertia
+                best_cluster_centers, best_counts, best_iterations = temp_cc, counts, iterations
+                if history:
+                    for previous in self.history[:-1]:
+                        previous['chosen'] = False
 
         # Save the best result to the self.cluster_centers
         self.cluster_centers = best_cluster_centers
+        self.counts = best_counts.astype(float)
+        self.inertia, self.iterations = loss, best_iterations
+        if build_index:
+            self.build_index()
 
-    def k_means(self, X, n_iter, init_cluster_centers):
-        """K-Means algorithm to minimize the loss function"""
+    def build_index(self):
+        """
+        Build a KD-tree over the cluster centers. predict then finds the
+        closest center of every sample in O(log K) for low dimensional data
+        (e.g. RGB colors) instead of comparing it with all the K centers.
+        Training the model again drops the index.
+        """
+        self.index = cKDTree(self.cluster_centers)
+
+    def single_run(self, X, seed, n_iter, init_cluster_centers=None, chunk_size=None,
+                   init='k-means++', tol=0, algorithm='lloyd', sample_weight=None,
+                   history=False):
+        """
+        One run of k_means seeded by seed.
+        Returns the loss, the cluster centers, the num of samples of every
+        cluster, the num of iterations of the run and its history (a dict as
+        described in fit if history is True, else None).
+        """
+        start_time = perf_counter()
+        run_history = {'seed': seed} if history else None
+        self.k_means(X, n_iter, init_cluster_centers, chunk_size, init, tol, algorithm,
+                     sample_weight, history=run_history, random_state=np.random.RandomState(seed))
+        labels, distances = self.assign(X, chunk_size=chunk_size)
+        counts = np.bincount(labels, weights=sample_weight, minlength=self.n_clusters)
+        inertia = distances.sum() if sample_weight is None else distances @ sample_weight
+        if history:
+            run_history.update(inertia=float(inertia), iterations=self.iterations,
+                               time=perf_counter() - start_time)
+        return inertia, self.cluster_centers, counts, self.iterations, run_history
+
+    def parallel_runs(self, X, seeds, run_args, n_jobs=-1, sample_weight=None):
+        """
+        Run single_run for every seed in a pool of n_jobs worker processes.
+        X and sample_weight are copied once to shared memory instead of being
+        pickled to every worker. Returns the results in the order of the seeds.
+        """
+        if n_jobs == -1:
+            n_jobs = os.cpu_count()
+
+        model_args = (self.n_clusters, self.n_features, self.dtype)
+        with share_arrays(X, sample_weight) as shared, \
+                ProcessPoolExecutor(max_workers=min(n_jobs, len(seeds))) as executor:
+            futures = [executor.submit(shared_run, restart_run, shared, model_args, seed,
+                                       run_args) for seed in seeds]
+            return [future.result() for future in futures]
+
+    def partial_fit(self, X, sample_weight=None):
+        """
+        Update the cluster centers by one chunk of samples (mini-batch K-Means).
+        Every center moves to the mean of all the samples that were ever
+        assigned to it, using the per-cluster counts, so the chunks are read
+        only once. The centers are initialized from the first chunk if the
+        model wasn't trained yet.
+        Arguments:
+            X (np.ndarray): Chunk of the dataset (e.g. a slice of np.memmap).
+            sample_weight (np.ndarray): Weight of every sample of the chunk.
+        """
+        self.index = None
+        if self.counts is None:
+            self.cluster_centers = self.init_centers(X, sample_weight=sample_weight)
+            self.counts = np.zeros(self.n_clusters)
+
+        # Associate each sample to cluster and add the chunk to the counts
+        labels, _ = self.assign(X)
+        samples_sum, count = self.cluster_sums(X, labels, sample_weight)
+        self.counts += count
+
+        # Move every updated center toward the mean of its new samples
+        updated = count > 0
+        self.cluster_centers[updated] += (
+            samples_sum[updated] - count[updated, None] * self.cluster_centers[updated]
+        ) / self.counts[updated, None]
+
+    def fit_stream(self, chunks):
+        """
+        Training the model in one pass over an iterable of chunks,
+        e.g. slices of np.memmap, CSV blocks or iter_batches(X, batch_size).
+        """
+        for chunk in chunks:
+            self.partial_fit(chunk)
+
+    def k_means(self, X, n_iter, init_cluster_centers, chunk_size=None, init='k-means++',
+                tol=0, algorithm='lloyd', sample_weight=None, x_squared_norms=None,
+                history=None, random_state=None):
+        """
+        K-Means algorithm to minimize the loss function.
+        Stops after n_iter iterations, when the labels don't change or when
+        the total squared shift of the centers is at most tol.
+        x_squared_norms are the squared norms of the samples if they were
+        already computed. If history is a dict, the initialization time and
+        the steps of the iterations are recorded in it (see fit).
+        random_state (np.random.RandomState) draws the initial centers
+        (None - np.random).
+        """
+        if algorithm not in ('lloyd', 'hamerly'):
+            raise ValueError(f"Unknown algorithm '{algorithm}'.")
+
+        start_time = perf_counter()
+        self.index = None
+
+        # The squared norms of the samples don't change between iterations
+        if x_squared_norms is None:
+            x_squared_norms = squared_norms(X, chunk_size, self.dtype)
 
         # Initialization of cluster centers
         if init_cluster_centers is None:
-            self.cluster_centers = self.random_init(X)
+            self.cluster_centers = self.init_centers(X, init, x_squared_norms, chunk_size,
+                                                     sample_weight, random_state)
         else:
-            self.cluster_centers = init_cluster_centers
+            self.cluster_centers = np.array(init_cluster_centers, dtype=self.dtype)
 
+        if history is not None:
+            history.update(init_time=perf_counter() - start_time, steps=[])
+
+        labels, bounds, shift = None, {}, None
+        self.iterations = 0
         for _ in range(n_iter):
             # Associate each sample to cluster
-            labels = self.predict(X)
+            step_time = perf_counter()
+            if algorithm == 'hamerly':
+                new_labels, distances = self.bounded_assign(
+                    X, bounds, shift, x_squared_norms, chunk_size)
+            else:
+                new_labels, distances = self.assign(X, x_squared_norms, chunk_size)
+            self.inertia = distances.sum() if sample_weight is None else distances @ sample_weight
+            label_changes = X.shape[0] if labels is None else np.count_nonzero(labels != new_labels)
+
+            if history is not None:
+                step = dict(inertia=float(self.inertia), label_changes=int(label_changes),
+                            empty_clusters=0, shift=0.0, update_time=0.0,
+                            assign_time=perf_counter() - step_time)
+                history['steps'].append(step)
+                step_time = perf_counter()
+
+            # Same labels give the same centers, so the algorithm converged
+            if label_changes == 0:
+                break
+            labels = new_labels
+            self.iterations += 1
 
             # Change cluster centers to the center of that samples
-            samples_sum = np.zeros((self.n_clusters, self.n_features))
-            count = np.zeros((self.n_clusters, 1))
-            for sample, label in zip(X, labels):
-                samples_sum[int(label)] += sample
-                count[int(label)] += 1
+            samples_sum, count = self.cluster_sums(X, labels, sample_weight)
+            old_cluster_centers = self.cluster_centers.copy()
 
             # Check if we have an empty cluster
-            if 0 in count:
-                new_center = self.farest_sample(X, count)
-                for k in range(self.n_clusters):
-                    # Assign new cluster to the farest sample from the bigest cluster
-                    if count[k, 0] == 0:
-                        self.cluster_centers[k] = new_center
-                    else:                       # Normal cluster center appdate
-                        self.cluster_centers[k] = samples_sum[k] / count[k]
-                continue
-
-            self.cluster_centers = samples_sum / count
-
-    def predict(self, X):
-        """Predict the labels of samples in the dataset X (np.ndarray)"""
-        labels = []
-        for sample in X:
-            label = min(range(self.n_clusters), key=lambda k: np.linalg.norm(
-                sample - self.cluster_centers[k])**2)
-            labels.append(label)
-        return np.array([labels]).T
-
-    def loss(self, X, labels):
+            empty = count == 0
+            if empty.any():
+                # Assign new cluster to the farest sample from the bigest cluster
+                new_center = self.farest_sample(X, count, chunk_size)
+                self.cluster_centers[~empty] = samples_sum[~empty] / count[~empty, None]
+                self.cluster_centers[empty] = new_center
+                # The reseeded centers may coincide, so the ties of the bounds
+                # could differ from Lloyd's argmin - start them over
+                bounds.clear()
+            else:
+                self.cluster_centers = (samples_sum / count[:, None]).astype(self.dtype)
+
+            # Stop when the centers almost don't move
+            shift = squared_norms(self.cluster_centers - old_cluster_centers, dtype=self.dtype)
+            if history is not None:
+                step.update(empty_clusters=int(empty.sum()), shift=float(shift.sum()),
+                            update_time=perf_counter() - step_time)
+            if shift.sum() <= tol:
+                break
+            shift = np.sqrt(shift)
+
+    def assign(self, X, x_squared_norms=None, chunk_size=None):
+        """
+        Return the label of the closest cluster center of every sample in X
+        and the squared distance to it.
+        The distances are expanded as ||x||^2 - 2<x, c> + ||c||^2, so every
+        block of chunk_size samples is assigned by a single matrix product.
+        """
+        if x_squared_norms is None:
+            x_squared_norms = squared_norms(X, chunk_size, self.dtype)
+
+        n_samples = X.shape[0]
+        labels = np.empty(n_samples, dtype=int)
+        min_distances = np.empty(n_samples, dtype=self.dtype)
+        centers_squared_norms = squared_norms(self.cluster_centers, dtype=self.dtype)
+
+        for start, stop in row_chunks(n_samples, chunk_size):
+            block = np.asarray(X[start:stop], dtype=self.dtype)
+
+            # ||x||^2 is the same for every cluster, so it doesn't affect the argmin
+            distances = block @ self.cluster_centers.T
+            distances *= -2
+            distances += centers_squared_norms
+            distances.argmin(axis=1, out=labels[start:stop])
+            min_distances[start:stop] = distances[np.arange(stop - start),
+                                                  labels[start:stop]]
+
+        min_distances += x_squared_norms
+        return labels, np.maximum(min_distances, 0, out=min_distances)
+
+    def two_closest(self, X, x_squared_norms=None, chunk_size=None):
+        """
+        Return the label of the closest cluster center of every sample in X,
+        the squared distance to it and the squared distance to the second
+        closest center.
+        Like assign, only a chunk_size x n_clusters block of distances is
+        built at once.
+        """
+        if x_squared_norms is None:
+            x_squared_norms = squared_norms(X, chunk_size, self.dtype)
+
+        n_samples = X.shape[0]
+        labels = np.empty(n_samples, dtype=int)
+        closest = np.empty(n_samples, dtype=self.dtype)
+        second = np.full(n_samples, np.inf, dtype=self.dtype)
+        centers_squared_norms = squared_norms(self.cluster_centers, dtype=self.dtype)
+
+        for start, stop in row_chunks(n_samples, chunk_size):
+            distances = np.asarray(X[start:stop], dtype=self.dtype) @ self.cluster_centers.T
+            distances *= -2
+            distances += centers_squared_norms
+            distances += x_squared_norms[start:stop, None]
+            np.maximum(distances, 0, out=distances)
+
+            rows, block_labels = np.arange(stop - start), labels[start:stop]
+            distances.argmin(axis=1, out=block_labels)
+            closest[start:stop] = distances[rows, block_labels]
+            if self.n_clusters > 1:
+                distances[rows, block_labels] = np.inf
+                distances.min(axis=1, out=second[start:stop])
+
+        return labels, closest, second
+
+    def bounded_assign(self, X, bounds, shift, x_squared_norms, chunk_size=None):
+        """
+        Hamerly's assignment step: like assign, but keeps in bounds an upper
+        bound on the distance of every sample to its center and a lower bound
+        on the distance to the second closest center. Only the samples whose
+        bounds can't prove that the label stays the same are reassigned.
+        Arguments:
+            X (np.ndarray): Dataset.
+            bounds (dict): The bounds of the previous iteration (empty on the
+                first iteration, then all the samples are assigned).
+            shift (np.ndarray): The distance each center moved since then.
+            x_squared_norms (np.ndarray): Squared norms of the samples.
+            chunk_size (int): Num of samples assigned at once.
+        Returns the labels and an upper bound of the squared distances.
+        """
+        if not bounds:
+            labels, closest, second = self.two_closest(X, x_squared_norms, chunk_size)
+            bounds.update(labels=labels, upper=np.sqrt(closest), lower=np.sqrt(second))
+            return labels.copy(), closest
+
+        labels, upper, lower = bounds['labels'], bounds['upper'], bounds['lower']
+
+        # Move the bounds by the shift of the centers
+        upper += shift[labels]
+        if self.n_clusters > 1:
+            first, second = np.argsort(shift)[:-3:-1]
+            lower -= np.where(labels == first, shift[second], shift[first])
+
+        # A sample keeps its label while it's closer than half the distance
+        # between its center and the closest other center
+        center_distances = np.sqrt(squared_distances(self.cluster_centers, self.cluster_centers))
+        np.fill_diagonal(center_distances, np.inf)
+        limit = np.maximum(center_distances.min(axis=1)[labels] / 2, lower)
+
+        # Tighten the upper bound of the samples that may change cluster
+        candidates = np.flatnonzero(upper > limit)
+        upper[candidates] = np.sqrt(squared_norms(
+            X[candidates] - self.cluster_centers[labels[candidates]], dtype=self.dtype))
+        candidates = candidates[upper[candidates] > limit[candidates]]
+
+        # Full assignment only for the samples the bounds don't decide
+        if candidates.size:
+            new_labels, closest, second = self.two_closest(
+                X[candidates], x_squared_norms[candidates], chunk_size)
+            labels[candidates] = new_labels
+            upper[candidates] = np.sqrt(closest)
+            lower[candidates] = np.sqrt(second)
+
+        return labels.copy(), upper**2
+
+    def split_cluster(self, X, cluster_centers, labels, distances):
+        """
+        Return n_clusters initial centers made of the n_clusters - 1
+        cluster_centers, where the cluster with the highest loss (sum of the
+        squared distances of its samples) is split in two along its principal
+        axis.
+        """
+        n_clusters = len(cluster_centers)
+        cluster_loss = np.bincount(labels, weights=distances, minlength=n_clusters)
+        worst = np.argmax(cluster_loss)
+
+        # Principal axis of the samples of the worst cluster
+        samples = np.asarray(X[labels == worst], dtype=self.dtype) - cluster_centers[worst]
+        if len(samples) > 1:
+            _, singular_values, axes = np.linalg.svd(samples, full_matrices=False)
+            offset = axes[0] * singular_values[0] / np.sqrt(len(samples))
+        else:
+            offset = np.zeros(X.shape[1], dtype=self.dtype)
+
+        new_centers = np.empty((n_clusters + 1, X.shape[1]), dtype=self.dtype)
+        new_centers[:n_clusters] = cluster_centers
+        new_centers[worst] -= offset
+        new_centers[n_clusters] = cluster_centers[worst] + offset
+        return new_centers
+
+    def cluster_sums(self, X, labels, sample_weight=None):
+        """
+        Return the (weighted) sum of the samples and the (weighted) num of
+        samples in every cluster.
+        """
+        count = np.bincount(labels, weights=sample_weight,
+                            minlength=self.n_clusters).astype(float)
+        samples_sum = np.empty((self.n_clusters, X.shape[1]))
+        for j in range(X.shape[1]):
+            column = X[:, j] if sample_weight is None else X[:, j] * sample_weight
+            samples_sum[:, j] = np.bincount(
+                labels, weights=column, minlength=self.n_clusters)
+        return samples_sum, count
+
+    def predict(self, X, chunk_size=None):
+        """
+        Predict the labels of samples in the dataset X (np.ndarray).
+        chunk_size (int): Num of samples assigned at once (None - all of them).
+        """
+        if self.index is None:
+            labels, _ = self.assign(X, chunk_size=chunk_size)
+            return labels[:, None]
+
+        # Nearest center by the KD-tree of build_index
+        labels = np.empty(X.shape[0], dtype=int)
+        for start, stop in row_chunks(X.shape[0], chunk_size):
+            _, labels[start:stop] = self.index.query(X[start:stop])
+        return labels[:, None]
+
+    def loss(self, X, labels, chunk_size=None):
         """Compute the loss by labeles dataset X and the cluster_centers"""
+        labels = np.asarray(labels, dtype=int).ravel()
         loss = 0
-        for sample, label in zip(X, labels):
-            loss += np.linalg.norm(sample -
-                                   self.cluster_centers[int(label)])**2
+        for start, stop in row_chunks(X.shape[0], chunk_size):
+            loss += squared_norms(X[start:stop] - self.cluster_centers[labels[start:stop]],
+                                  dtype=self.dtype).sum()
         return loss
 
-    def farest_sample(self, X, count):
+    def farest_sample(self, X, count, chunk_size=None):
         """Return the farest sample from the bigest cluster"""
-        index = max(range(self.n_clusters), key=lambda k: int(count[k]))
-        largest_cluster = self.cluster_centers[index]
-        return max(X, key=lambda x: np.linalg.norm(x - largest_cluster))
+        largest_cluster = self.cluster_centers[np.argmax(count)]
+        distances = np.empty(X.shape[0], dtype=self.dtype)
+        for start, stop in row_chunks(X.shape[0], chunk_size):
+            distances[start:stop] = squared_norms(X[start:stop] - largest_cluster,
+                                                  dtype=self.dtype)
+        return X[np.argmax(distances)]
+
+
+def sweep_clusters(X, n_clusters_range, n_iter, tol=0, chunk_size=None, algorithm='lloyd',
+                   sample_weight=None, dtype=np.float64):
+    """
+    Fit K-Means for every num of clusters in n_clusters_range, e.g. to choose
+    K by the elbow method. The first K is seeded by k-means++, then every
+    solution is warm started from the previous one by splitting the cluster
+    with the highest loss in two along its principal axis, so every K needs
+    only a few iterations. The squared norms of the samples are computed once.
+    Arguments:
+        X (np.ndarray): Dataset.
+        n_clusters_range (iterable): Increasing nums of clusters.
+        n_iter, tol, chunk_size, algorithm, sample_weight: As in KMeans.fit.
+        dtype (np.dtype): Floating type of the computations.
+    Returns the loss of every K (np.ndarray) and the list of cluster centers.
+    """
+    n_clusters_range = list(n_clusters_range)
+    if (not n_clusters_range or n_clusters_range != sorted(set(n_clusters_range))
+            or n_clusters_range[0] < 1):
+        raise ValueError("n_clusters_range must be increasing positive nums.")
+
+    x_squared_norms = squared_norms(X, chunk_size, dtype)
+    inertias, centers = [], []
+    cluster_centers = None
+    for n_clusters in range(n_clusters_range[0], n_clusters_range[-1] + 1):
+        model = KMeans(n_clusters, X.shape[1], dtype)
+        if cluster_centers is not None:
+            cluster_centers = model.split_cluster(X, cluster_centers, labels, distances)
+        model.k_means(X, n_iter, cluster_centers, chunk_size, tol=tol, algorithm=algorithm,
+                      sample_weight=sample_weight, x_squared_norms=x_squared_norms)
+        cluster_centers = model.cluster_centers
+        labels, distances = model.assign(X, x_squared_norms, chunk_size)
+        if sample_weight is not None:
+            distances = distances * sample_weight
+
+        if n_clusters in n_clusters_range:
+            inertias.append(distances.sum())
+            centers.append(cluster_centers)
+
+    return np.array(inertias), centers
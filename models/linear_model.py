@@ -1,29 +1,377 @@
 from .model_base import Model
 import numpy as np
+from scipy import sparse
+from scipy.linalg import cho_factor, cho_solve, LinAlgError
+from scipy.optimize import minimize
+from scipy.sparse.linalg import LinearOperator
+from scipy.special import expit
 
 
-class LinearRegressionModel(Model):
+class Optimizer:
     """
-    A model for Linear Regression.
+    Update rule of the weights for (mini-batch) gradient descent.
+    Arguments:
+        learn_rate (float): The rate of the learning of the model.
+        method (str): 'sgd' - plain gradient steps.
+                      'momentum' - steps by a decaying sum of the gradients.
+                      'adam' - Adam, steps by the bias corrected first moment
+                          of the gradients over the root of their second moment.
+        momentum (float): Decay of the sum of the gradients (the first moment of 'adam').
+        beta2 (float): Decay of the second moment of 'adam'.
+        epsilon (float): Avoids division by zero in 'adam'.
+    """
+
+    def __init__(self, learn_rate, method='sgd', momentum=0.9, beta2=0.999, epsilon=1e-8):
+        if method not in ('sgd', 'momentum', 'adam'):
+            raise ValueError(f"Unknown optimizer '{method}'.")
+        self.learn_rate = learn_rate
+        self.method = method
+        self.momentum = momentum
+        self.beta2 = beta2
+        self.epsilon = epsilon
+        self.steps = 0
+        self.velocity = None
+        self.second_moment = None
+
+    def step(self, weights, gradient):
+        """Update the weights (np.ndarray) in place by the gradient of the loss"""
+        self.steps += 1
+        if self.method == 'sgd':
+            weights -= self.learn_rate * gradient
+            return
+
+        if self.velocity is None:
+            self.velocity = np.zeros_like(weights)
+            self.second_moment = np.zeros_like(weights)
+
+        if self.method == 'momentum':
+            self.velocity *= self.momentum
+            self.velocity += gradient
+            weights -= self.learn_rate * self.velocity
+            return
+
+        # Adam
+        self.velocity *= self.momentum
+        self.velocity += (1 - self.momentum) * gradient
+        self.second_moment *= self.beta2
+        self.second_moment += (1 - self.beta2) * gradient**2
+        first = self.velocity / (1 - self.momentum**self.steps)
+        second = self.second_moment / (1 - self.beta2**self.steps)
+        weights -= self.learn_rate * first / (np.sqrt(second) + self.epsilon)
+
+
+class SparseDesignMatrix(LinearOperator):
+    """
+    The design-matrix [1, (X - mean) / std] of a scipy.sparse dataset X,
+    without densifying it: the bias column and the normalization are
+    applied on the products (dm_X @ W and dm_X.T @ R), so their cost scales
+    with the nonzeros of X. Indexing by rows gives the design-matrix of the
+    rows.
+    Arguments:
+        X (scipy.sparse matrix): Dataset.
+        mean, std (np.ndarray): Normalization of the features, None - none.
+    """
+
+    def __init__(self, X, mean=None, std=None):
+        self.X = X.tocsr()
+        self.mean = mean
+        self.std = std
+        super().__init__(X.dtype, (X.shape[0], X.shape[1] + 1))
+
+    def __getitem__(self, rows):
+        return SparseDesignMatrix(self.X[rows], self.mean, self.std)
+
+    def _matmat(self, W):
+        coef, bias = W[1:], W[0]
+        if self.std is not None:
+            coef = coef / self.std.reshape(-1, 1)
+            bias = bias - self.mean @ coef
+        return self.X @ coef + bias
+
+    def _rmatmat(self, R):
+        sums = R.sum(axis=0)
+        product = np.empty((self.shape[1], R.shape[1]), dtype=np.result_type(self.dtype, R))
+        product[0] = sums
+        product[1:] = self.X.T @ R
+        if self.std is not None:
+            product[1:] -= np.outer(self.mean, sums)
+            product[1:] /= self.std.reshape(-1, 1)
+        return product
+
+
+def model_design_matrix(model, X, fit):
+    """
+    The design-matrix of dataset X for the model, normalized if the model
+    normalizes (fit - compute its mean and std by X first). A
+    SparseDesignMatrix for a scipy.sparse X.
+    """
+    if not sparse.issparse(X):
+        X = np.asarray(X, dtype=model.dtype)
+        if model.normalize:
+            X = model.normalize_matrix(X, fit)
+        return model.design_matrix(X, model.dtype)
+
+    X = sparse.csr_matrix(X, dtype=model.dtype)
+    if not model.normalize:
+        return SparseDesignMatrix(X)
+    if fit:
+        model.mean = np.asarray(X.mean(axis=0)).ravel()
+        squares_mean = np.asarray(X.multiply(X).mean(axis=0)).ravel()
+        model.std = np.sqrt(np.maximum(squares_mean - model.mean**2, 0))
+        if 0 in model.std:
+            raise ValueError('The variance of the data is 0, meaning prediction has no meaning.')
+    return SparseDesignMatrix(X, model.mean, model.std)
+
+
+def matmul(A, B, out=None):
+    """A @ B into out (None - a new array) for a dense or a sparse A"""
+    if isinstance(A, np.ndarray):
+        return np.matmul(A, B, out=out)
+    if out is None:
+        return A @ B
+    out[...] = A @ B
+    return out
+
+
+def l2_penalty(weights, alpha, gradient):
+    """
+    Add the gradient of the L2 penalty alpha/2 ||W||^2 of the weights (the
+    bias row excluded) to gradient and return the penalty.
+    """
+    if not alpha:
+        return 0
+    gradient[1:] += alpha * weights[1:]
+    return alpha / 2 * np.vdot(weights[1:], weights[1:])
+
+
+def validation_split(dm_X, Y, validation_fraction):
+    """Split the samples randomly to ((dm_X, Y) of training, (dm_X, Y) of validation)"""
+    n_samples = dm_X.shape[0]
+    n_validation = int(round(n_samples * validation_fraction))
+    if not 0 < n_validation < n_samples:
+        raise ValueError(f'validation_fraction {validation_fraction} leaves no samples '
+                         'for training or for validation.')
+    order = np.random.permutation(n_samples)
+    training, validation = order[n_validation:], order[:n_validation]
+    return (dm_X[training], Y[training]), (dm_X[validation], Y[validation])
+
+
+def minibatch_descent(model, dm_X, Y, epochs, optimizer, batch_size=None, shuffle=True,
+                      tol=None, patience=5, validation=None):
+    """
+    Epochs of (mini-batch) gradient descent on the weights of the model by
+    the gradients of model.loss_gradient(dm_X, Y).
+    Every epoch goes over the samples in batches of batch_size (None - one
+    batch of the whole dataset), in a new random order if shuffle is True.
+    dm_X is an np.ndarray or a SparseDesignMatrix.
+    Early stopping (if tol is given): stops when the loss (of the pair
+    validation=(dm_X, Y), if given) didn't improve by more than tol for
+    patience epochs in a row, or, with a full batch, when the norm of the
+    gradient is below tol.
+    Returns (the loss of every epoch - the mean loss of its batches,
+             the validation loss of every epoch).
+    """
+    n_samples = dm_X.shape[0]
+    batch_size = min(batch_size or n_samples, n_samples)
+    shuffle = shuffle and batch_size < n_samples
+    dense = isinstance(dm_X, np.ndarray)
+
+    # Work buffers of the batches, the residuals and the gradient, reused by
+    # every step so the loop doesn't allocate sample-sized temporaries
+    if shuffle and dense:
+        batch_X = np.empty((batch_size, dm_X.shape[1]), dtype=dm_X.dtype)
+        batch_Y = np.empty((batch_size, Y.shape[1]), dtype=Y.dtype)
+    residual = np.empty((batch_size, Y.shape[1]), dtype=model.weights.dtype)
+    gradient = np.empty_like(model.weights)
+    if validation is not None:
+        validation_residual = np.empty((validation[1].shape[0], Y.shape[1]),
+                                       dtype=model.weights.dtype)
+
+    losses, validation_losses = [], []
+    best_loss, bad_epochs = np.inf, 0
+    for _ in range(epochs):
+        order = np.random.permutation(n_samples) if shuffle else None
+        epoch_loss = 0
+        for start in range(0, n_samples, batch_size):
+            stop = min(start + batch_size, n_samples)
+            if order is None:
+                X_rows, Y_rows = dm_X[start:stop], Y[start:stop]
+            elif not dense:
+                X_rows, Y_rows = dm_X[order[start:stop]], Y[order[start:stop]]
+            else:
+                X_rows = np.take(dm_X, order[start:stop], axis=0, out=batch_X[:stop - start])
+                Y_rows = np.take(Y, order[start:stop], axis=0, out=batch_Y[:stop - start])
+            loss, _ = model.loss_gradient(X_rows, Y_rows, residual[:stop - start], gradient)
+            epoch_loss += loss * (stop - start)
+            optimizer.step(model.weights, gradient)
+        losses.append(epoch_loss / n_samples)
+        if validation is not None:
+            validation_losses.append(
+                model.loss_gradient(*validation, validation_residual, np.empty_like(gradient))[0])
+
+        if tol is None:
+            continue
+        if batch_size == n_samples and np.linalg.norm(gradient) < tol:
+            break
+        loss = validation_losses[-1] if validation is not None else losses[-1]
+        if loss < best_loss - tol:
+            best_loss, bad_epochs = loss, 0
+        else:
+            bad_epochs += 1
+            if bad_epochs >= patience:
+                break
+    return losses, validation_losses
+
+
+def descent_fit(model, dm_X, Y, epochs, learn_rate, batch_size=None, shuffle=True,
+                optimizer='sgd', tol=None, patience=5, validation_fraction=None):
+    """
+    Gradient descent training of the model by minibatch_descent, with a new
+    Optimizer and validation_fraction of the samples held out for the early
+    stopping. Sets optimizer, loss_history, validation_history and
+    iterations of the model.
+    """
+    validation = None
+    if validation_fraction:
+        (dm_X, Y), validation = validation_split(dm_X, Y, validation_fraction)
+    model.optimizer = Optimizer(learn_rate, optimizer)
+    model.loss_history, model.validation_history = minibatch_descent(
+        model, dm_X, Y, epochs, model.optimizer, batch_size, shuffle, tol, patience, validation)
+    model.iterations = len(model.loss_history)
+
+
+def partial_step(model, dm_X, Y, learn_rate, optimizer='sgd'):
+    """
+    One gradient step of partial_fit of the model. Its Optimizer
+    (partial_optimizer) is kept between the calls, apart from the one of the
+    last fit, and is replaced when learn_rate or optimizer changes.
+    """
+    state = model.partial_optimizer
+    if state is None or (state.learn_rate, state.method) != (learn_rate, optimizer):
+        model.partial_optimizer = Optimizer(learn_rate, optimizer)
+    _, gradient = model.loss_gradient(dm_X, Y)
+    model.partial_optimizer.step(model.weights, gradient)
+
+
+def lbfgs_fit(model, dm_X, Y, max_iter=100, tol=1e-6):
+    """
+    L-BFGS (scipy.optimize) on the loss of the model by model.loss_gradient,
+    until the gradient norm is below tol. Sets weights and iterations of
+    the model.
+    """
+    shape = model.weights.shape
+    residual = np.empty((Y.shape[0], shape[1]), dtype=model.dtype)
+    gradient = np.empty_like(model.weights)
+
+    def loss_and_gradient(weights):
+        model.weights = weights.reshape(shape).astype(model.dtype)
+        loss, _ = model.loss_gradient(dm_X, Y, residual, gradient)
+        return loss, gradient.ravel().astype(float)
+
+    # The default relative ftol of L-BFGS-B stops long before a small tol
+    result = minimize(loss_and_gradient, model.weights.ravel().astype(float), jac=True,
+                      method='L-BFGS-B',
+                      options={'maxiter': max_iter, 'gtol': tol, 'ftol': np.finfo(float).eps})
+    model.weights = result.x.reshape(shape).astype(model.dtype)
+    model.iterations = result.nit
+
+
+class LinearPredictor:
+    """
+    A frozen linear predictor, link(X @ coef + bias), that predicts straight
+    from the raw dataset X - one matrix product per (chunk of) X, without
+    normalized copies or design-matrices.
+    Arguments:
+        coef (np.ndarray): Weights of the features (input_features x C).
+        bias (np.ndarray): Bias of every output (C).
+        link (function): In place function of the output, link(Z, out=Z)
+            (e.g. the sigmoid). None - the identity.
+    """
+
+    def __init__(self, coef, bias, link=None):
+        self.coef = coef
+        self.bias = bias
+        self.link = link
+
+    @classmethod
+    def fold(cls, weights, mean=None, std=None, link=None):
+        """
+        The predictor of the weights of a model (bias in the first row) on
+        the normalized features (X - mean) / std, with the normalization
+        folded into the coef and the bias.
+        """
+        coef, bias = weights[1:], weights[0]
+        if mean is not None:
+            coef = weights[1:] / std.reshape(-1, 1).astype(np.float64)
+            bias = bias - mean.astype(np.float64) @ coef
+        return cls(coef.astype(weights.dtype), bias.astype(weights.dtype), link)
+
+    def predict(self, X, out=None, chunk_size=None):
+        """
+        Predict the output of the dataset X (N x input_features, dense or
+        scipy.sparse) into out (N x C, a new array if None) in chunks of
+        chunk_size rows (None - all the rows at once).
+        """
+        if sparse.issparse(X):
+            X = sparse.csr_matrix(X)
+        else:
+            X = np.asarray(X)
+            X = X.reshape(X.shape[0], -1)
+        n_samples = X.shape[0]
+        if out is None:
+            out = np.empty((n_samples, self.coef.shape[1]), dtype=self.coef.dtype)
+        chunk_size = chunk_size or max(n_samples, 1)
+        for start in range(0, n_samples, chunk_size):
+            rows = slice(start, start + chunk_size)
+            matmul(X[rows].astype(self.coef.dtype, copy=False), self.coef, out=out[rows])
+            out[rows] += self.bias
+            if self.link is not None:
+                self.link(out[rows], out=out[rows])
+        return out
+
+
+class LinearModel(Model):
+    """
+    Base class of the linear models: the weights ((input_features + 1) x
+    output_features, the bias in the first row), the normalization of the
+    features and the state of the training. Subclasses define loss_gradient
+    and may convert the true values by targets.
     Arguments:
         input_features (int)
         output_features (int)
         normalize (bool)
+        dtype (np.dtype): Floating type of the weights and the computations.
+        alpha (float): L2 penalty of the weights (the bias excluded).
     """
 
-    def __init__(self, input_features, output_features, normalize=False):
+    def __init__(self, input_features, output_features, normalize=False, dtype=np.float64,
+                 alpha=0.0):
         self.input_features = input_features
         self.output_features = output_features
-        self.weights = np.zeros((input_features + 1, output_features))
+        self.dtype = np.dtype(dtype)
+        self.alpha = alpha
+        self.weights = np.zeros((input_features + 1, output_features), dtype=self.dtype)
         self.normalize = normalize
         if normalize:
-            self.std = np.zeros(input_features)
-            self.mean = np.zeros(input_features)
+            self.std = np.zeros(input_features, dtype=self.dtype)
+            self.mean = np.zeros(input_features, dtype=self.dtype)
+        # Optimizer of the last GD training and the optimizer state of partial_fit
+        self.optimizer = None
+        self.partial_optimizer = None
+        # Loss of every epoch of the last GD training (and of the validation set)
+        self.loss_history = []
+        self.validation_history = []
+        # Num of iterations (epochs) of the last training
+        self.iterations = 0
 
     @staticmethod
-    def design_matrix(X):
-        """Take dataset X and return the design-matrix (dm_X)"""
-        return np.c_[np.ones(X.shape[0]), X]
+    def design_matrix(X, dtype=np.float64):
+        """Take dataset X and return the design-matrix (dm_X) of type dtype"""
+        X = X.reshape(X.shape[0], -1)
+        dm_X = np.empty((X.shape[0], X.shape[1] + 1), dtype=dtype)
+        dm_X[:, 0] = 1
+        dm_X[:, 1:] = X
+        return dm_X
 
     def normalize_matrix(self, X, fit):
         """Take dataset X and return the normalize matrix"""
@@ -36,38 +384,235 @@ class LinearRegressionModel(Model):
 
         return (X - self.mean) / self.std
 
-    def predict(self, X):
-        """Predict the output after training by given dataset X"""
+    def targets(self, y):
+        """The true values y as an array of the dtype of the model"""
+        return np.asarray(y, dtype=self.dtype)
+
+    def partial_fit(self, X, y, learn_rate, optimizer='sgd'):
+        """
+        One gradient step by the batch X, y (e.g. of a stream of data).
+        The optimizer state is kept between the calls (apart from the one
+        of fit) and restarts when learn_rate or optimizer changes. With
+        normalize, the mean and std of the first batch are used if the model
+        wasn't trained.
+        Arguments:
+            X (np.ndarray): Batch of the dataset.
+            y (np.ndarray): True values of the batch (see targets).
+            learn_rate (float): The rate of the learning of the model.
+            optimizer (str): 'sgd', 'momentum' or 'adam' (see Optimizer).
+        """
+        dm_X = model_design_matrix(self, X, self.normalize and not self.std.any())
+        partial_step(self, dm_X, self.targets(y), learn_rate, optimizer)
+
+
+class LinearRegressionModel(LinearModel):
+    """
+    A model for Linear Regression.
+    Arguments:
+        input_features (int)
+        output_features (int)
+        normalize (bool)
+        dtype (np.dtype): Floating type of the weights and the computations.
+        alpha (float): Ridge penalty, the loss is MSE + alpha/2 ||W||^2 (the
+            bias excluded, of the normalized features if normalize).
+    """
+
+    def freeze(self):
+        """
+        Return a LinearPredictor of the current weights, with the
+        normalization folded into them, to predict from the raw X.
+        """
         if self.normalize:
-            return self.design_matrix(self.normalize_matrix(X, False)) @ self.weights
+            return LinearPredictor.fold(self.weights, self.mean, self.std)
+        return LinearPredictor.fold(self.weights)
 
-        # Predict without normalization
-        return self.design_matrix(X) @ self.weights
+    def predict(self, X, out=None, chunk_size=None):
+        """
+        Predict the output after training by given dataset X
+        (see LinearPredictor.predict for out and chunk_size).
+        """
+        return self.freeze().predict(X, out, chunk_size)
 
-    def fit(self, X, Y, epochs=None, learn_rate=None):
+    def fit(self, X, Y, epochs=None, learn_rate=None, batch_size=None, shuffle=True,
+            optimizer='sgd', tol=None, patience=5, validation_fraction=None):
         """
         Training the model by dataset X and the true values of Y.
         Arguments:
             X (np.ndarray): Dataset.
             Y (np.ndarray): True values.
             Arguments for 'Gradient Descent' method:
-                epochs (int): Num of iteration on GD function.
+                epochs (int): Max num of iteration on GD function.
                 learn_rate (float): The rate of the learning of the model.
+                batch_size (int): Num of samples of every step (mini-batch
+                    SGD). None - full batch gradient descent.
+                shuffle (bool): Go over the samples in a random order every epoch.
+                optimizer (str): 'sgd', 'momentum' or 'adam' (see Optimizer).
+                tol (float): Early stopping when the loss didn't improve by
+                    more than tol for patience epochs (see minibatch_descent).
+                    None - run all the epochs.
+                patience (int): Num of epochs without improvement to stop.
+                validation_fraction (float): Fraction of the samples held
+                    out to decide the early stopping by their loss.
+            The losses of the epochs are recorded in self.loss_history (and
+            self.validation_history), self.iterations is the num of epochs.
         """
-        if self.normalize:  # Normalize the matrix
-            dm_X = self.design_matrix(self.normalize_matrix(X, True))
-        else:
-            dm_X = self.design_matrix(X)
+        # 'Normal equation' method if learn_rate or epochs wasn't given
+        if not (learn_rate and epochs):
+            self.fit_chunks([(X, Y)])
+            return
 
-        # 'Gradient Descent' method if learn_rate and epochs was given
-        if learn_rate and epochs:
-            for _ in range(epochs):  # Calculate the new weights by vectorization approach
-                self.weights -= (learn_rate /
-                                 Y.shape[0]) * dm_X.T @ (dm_X @ self.weights - Y)
+        Y = np.asarray(Y, dtype=self.dtype)
+        dm_X = model_design_matrix(self, X, True)
 
-        # 'Normal equation' method if learn_rate or epochs wasn't given
+        # 'Gradient Descent' method
+        descent_fit(self, dm_X, Y, epochs, learn_rate, batch_size, shuffle, optimizer, tol,
+                    patience, validation_fraction)
+
+    def loss_gradient(self, dm_X, Y, residual=None, out=None):
+        """
+        The MSE loss (with the ridge penalty) and its gradient by the weights
+        for the design-matrix dm_X. residual (N x output_features) and out
+        (the gradient) are optional work buffers.
+        """
+        residual = matmul(dm_X, self.weights, out=residual)
+        residual -= Y
+        loss = np.vdot(residual, residual) / (2 * Y.shape[0])
+        out = matmul(dm_X.T, residual, out=out)
+        out /= Y.shape[0]
+        return loss + l2_penalty(self.weights, self.alpha, out), out
+
+    def sufficient_statistics(self, X, Y):
+        """
+        Return the sufficient statistics of least squares for the chunk X, Y:
+        (num of samples, mean of X, mean of Y, scatter matrix of X,
+        cross scatter matrix of X and Y), where the scatter matrices are
+        the centered X^T X and X^T Y.
+        """
+        Y = np.asarray(Y, dtype=self.dtype).reshape(Y.shape[0], -1)
+        mean_y = Y.mean(axis=0)
+        if sparse.issparse(X):
+            # Centering is applied on the products, keeping X sparse
+            X = sparse.csr_matrix(X, dtype=np.float64)
+            mean_x = np.asarray(X.mean(axis=0)).ravel()
+            scatter = (X.T @ X).toarray() - X.shape[0] * np.outer(mean_x, mean_x)
+            return (X.shape[0], mean_x, mean_y.astype(float), scatter,
+                    np.asarray(X.T @ (Y - mean_y), dtype=float))
+
+        X = np.asarray(X, dtype=self.dtype).reshape(len(X), -1)
+        mean_x = X.mean(axis=0)
+        centered_x = X - mean_x
+        return (X.shape[0], mean_x.astype(float), mean_y.astype(float),
+                (centered_x.T @ centered_x).astype(float),
+                (centered_x.T @ (Y - mean_y)).astype(float))
+
+    @staticmethod
+    def merge_statistics(stats_a, stats_b):
+        """
+        Merge the sufficient statistics of two chunks (Chan's parallel
+        update of the means and the scatter matrices). The merge is
+        associative, so the chunks can be reduced in any order, e.g. from
+        parallel workers.
+        """
+        n_a, mean_xa, mean_ya, scatter_a, cross_a = stats_a
+        n_b, mean_xb, mean_yb, scatter_b, cross_b = stats_b
+        n = n_a + n_b
+        delta_x, delta_y = mean_xb - mean_xa, mean_yb - mean_ya
+        factor = n_a * n_b / n
+        return (n, mean_xa + delta_x * n_b / n, mean_ya + delta_y * n_b / n,
+                scatter_a + scatter_b + factor * np.outer(delta_x, delta_x),
+                cross_a + cross_b + factor * np.outer(delta_x, delta_y))
+
+    def fit_chunks(self, chunks):
+        """
+        Exact least squares training in one pass over an iterable of
+        (X, Y) chunks (e.g. slices of np.memmap or CSV blocks), so the
+        dataset doesn't have to fit in memory.
+        The sufficient statistics of the chunks are merged and the normal
+        equation of the normalized features is solved once by Cholesky
+        factorization (least squares if the features are collinear).
+        """
+        stats = None
+        for X, Y in chunks:
+            chunk_stats = self.sufficient_statistics(X, Y)
+            stats = chunk_stats if stats is None else self.merge_statistics(stats, chunk_stats)
+        if stats is None:
+            raise ValueError('The chunks have no samples.')
+        self.solve_statistics(stats)
+
+    def normal_equation(self, stats):
+        """
+        Return the normal equation (gram, moments, scale) of the sufficient
+        statistics for the features scaled by 1 / scale - their std, where
+        it is well conditioned. With normalize, sets self.mean and self.std.
+        """
+        n, mean_x, mean_y, scatter, cross = stats
+        std = np.sqrt(np.diag(scatter) / n)
+        if self.normalize:
+            if 0 in std:
+                raise ValueError(
+                    'The variance of the data is 0, meaning prediction has no meaning.')
+            self.mean, self.std = mean_x.astype(self.dtype), std.astype(self.dtype)
+
+        scale = np.where(std > 0, std, 1)
+        return scatter / np.outer(scale, scale), cross / scale[:, None], scale
+
+    def statistics_weights(self, stats, slopes, scale):
+        """The weights of the slopes of the features scaled by 1 / scale"""
+        _, mean_x, mean_y, _, _ = stats
+        weights = np.empty((len(mean_x) + 1, len(mean_y)))
+        if self.normalize:
+            weights[0], weights[1:] = mean_y, slopes
         else:
-            self.weights = np.linalg.inv(dm_X.T @ dm_X) @ dm_X.T @ Y
+            weights[1:] = slopes / scale[:, None]
+            weights[0] = mean_y - mean_x @ weights[1:]
+        return weights.astype(self.dtype)
+
+    def solve_statistics(self, stats):
+        """
+        Set the weights to the (ridge) least squares solution of the
+        sufficient statistics.
+        """
+        gram, moments, scale = self.normal_equation(stats)
+        if self.alpha:
+            # The penalty n * alpha ||W||^2 of the weights of the scaled features
+            penalty = stats[0] * self.alpha * (1 if self.normalize else 1 / scale**2)
+            gram[np.diag_indices_from(gram)] += penalty
+        try:
+            slopes = cho_solve(cho_factor(gram), moments)
+        except LinAlgError:
+            slopes = np.linalg.lstsq(gram, moments, rcond=None)[0]
+        self.weights = self.statistics_weights(stats, slopes, scale)
+
+    def fit_path(self, X, Y, alphas):
+        """
+        Ridge solutions of the dataset X and true values Y for every penalty
+        of alphas, from one scatter matrix and one eigendecomposition of it:
+        with gram = V diag(eigenvalues) V^T, the slopes of every alpha are
+        V diag(1 / (eigenvalues + N * alpha)) V^T moments, O(features^2)
+        per alpha.
+        Returns the weights of every alpha (len(alphas) x input_features+1 x
+        output_features). The model is left with the last alpha.
+        """
+        stats = self.sufficient_statistics(X, Y)
+        gram, moments, scale = self.normal_equation(stats)
+        if not self.normalize:
+            # The penalty of the raw weights is isotropic in the raw space
+            gram, moments = gram * np.outer(scale, scale), moments * scale[:, None]
+            scale = np.ones_like(scale)
+        eigenvalues, vectors = np.linalg.eigh(gram)
+        projected_moments = vectors.T @ moments
+        cutoff = eigenvalues.max(initial=0) * len(eigenvalues) * np.finfo(float).eps
+
+        path = []
+        for alpha in alphas:
+            denominators = eigenvalues + stats[0] * alpha
+            # Pseudo-inverse of the singular directions without a penalty
+            inverse = np.divide(1, denominators, out=np.zeros_like(denominators),
+                                where=denominators > cutoff)
+            slopes = vectors @ (projected_moments * inverse[:, None])
+            path.append(self.statistics_weights(stats, slopes, scale))
+        self.alpha, self.weights = alphas[-1], path[-1].copy()
+        return np.stack(path)
 
     def loss(self, Y_prediction, Y_true):
         """ Mean Squared Error (MSE) loss.
@@ -88,44 +633,59 @@ class LinearRegressionModel(Model):
         return 1 / (2*batch_size) * np.sum((Y_true - Y_prediction)**2)
 
 
-class LogisticRegressionModel(Model):
+class LogisticRegressionModel(LinearModel):
     """
     A model for Logistic Regression i.e. classification.
     Arguments:
         input_features (int)
         normalize (bool)
+        dtype (np.dtype): Floating type of the weights and the computations.
+        alpha (float): L2 penalty, the loss is the cross entropy +
+            alpha/2 ||W||^2 (the bias excluded, of the normalized features
+            if normalize).
     """
 
-    def __init__(self, input_features, normalize=False):
-        self.input_features = input_features
-        self.weights = np.zeros((input_features + 1, 1))
-        self.normalize = normalize
-        if normalize:
-            self.std = np.zeros(input_features)
-            self.mean = np.zeros(input_features)
+    def __init__(self, input_features, normalize=False, dtype=np.float64, alpha=0.0):
+        super().__init__(input_features, 1, normalize, dtype, alpha)
 
     @staticmethod
-    def design_matrix(X):
-        """Take dataset X and return the design-matrix (dm_X)"""
-        return np.c_[np.ones(X.shape[0]), X]
+    def sigmoid_fn(z, out=None):
+        """
+        Calculate the Sigmoid-function of an array or a scalar
+        (numerically stable, no overflow for large |z|).
+        """
+        return expit(z, out=out)
 
     @staticmethod
-    def sigmoid_fn(z):
-        """Calculate the Sigmoid-function of an array or a scalar"""
-        return 1/(1+np.exp(-z))
-
-    def normalize_matrix(self, X, fit):
-        """Take dataset X and return the normalize matrix"""
-        if fit:
-            self.mean = X.mean(axis=0)
-            self.std = X.std(axis=0)
-            if 0 in self.std:
-                raise ValueError(
-                    'The variance of the data is 0, meaning prediction has no meaning.')
+    def cross_entropy_kernel(z, y, out=None):
+        """
+        Fused and numerically stable cross entropy of the logits z:
+        writes the gradient by z, sigmoid(z) - y, to out and returns
+        (sum of the losses, out). The loss of every sample is computed as
+        log(1 + e^z) - y*z, which never overflows, and no temporaries of
+        the size of z are allocated if out is given (out may be z itself).
+        """
+        y_z = np.vdot(y, z)
+        out = np.logaddexp(0, z, out=out)
+        loss = out.sum() - y_z
+        # 1 - sigmoid(z) = e^-log(1 + e^z)
+        np.negative(out, out=out)
+        np.exp(out, out=out)
+        np.subtract(1, out, out=out)
+        out -= y
+        return loss, out
 
-        return (X - self.mean) / self.std
+    def freeze(self):
+        """
+        Return a LinearPredictor of the probabilities by the current
+        weights, with the normalization folded into them, to predict from
+        the raw X.
+        """
+        if self.normalize:
+            return LinearPredictor.fold(self.weights, self.mean, self.std, self.sigmoid_fn)
+        return LinearPredictor.fold(self.weights, link=self.sigmoid_fn)
 
-    def predict(self, X, prob=False):
+    def predict(self, X, prob=False, out=None, chunk_size=None):
         """
         Predict the output after training by given dataset X
         Arguments:
@@ -133,37 +693,276 @@ class LogisticRegressionModel(Model):
             prob (bool):
                 True - return the probability of each case to be true (1).
                 False - return the prediction of each case 1 or 0.
+            out (np.ndarray): Buffer of the output (N x 1).
+            chunk_size (int): Num of rows to predict at once.
         """
-        if self.normalize:  # Normalize the matrix
-            dm_X = self.design_matrix(self.normalize_matrix(X, False))
-        else:
-            dm_X = self.design_matrix(X)
-
         # Calculate the probability of each case to be True (1)
-        prob_matrix = self.sigmoid_fn(dm_X @ self.weights)
+        prob_matrix = self.freeze().predict(X, out, chunk_size)
         # Return 1 if probability > 0.5 else 0
-        return prob_matrix if prob else np.round(prob_matrix)
+        return prob_matrix if prob else np.round(prob_matrix, out=prob_matrix)
 
-    def fit(self, X, y, epochs=None, learn_rate=None):
+    def fit(self, X, y, epochs=None, learn_rate=None, batch_size=None, shuffle=True,
+            optimizer='sgd', solver='gd', tol=None, patience=5, validation_fraction=None):
         """
         Training the model by dataset X and the true values of y.
         Arguments:
             X (np.ndarray): Dataset.
             Y (np.ndarray): True values.
-            epochs (int): Num of iteration on GD function.
+            epochs (int): Num of iteration on GD function (max num of
+                iterations of 'newton' and 'lbfgs', default 100).
             learn_rate (float): The rate of the learning of the model.
+            batch_size (int): Num of samples of every step (mini-batch SGD).
+                None - full batch gradient descent.
+            shuffle (bool): Go over the samples in a random order every epoch.
+            optimizer (str): 'sgd', 'momentum' or 'adam' (see Optimizer).
+            solver (str): 'gd' - gradient descent by learn_rate and epochs.
+                          'newton' - Newton's method (IRLS), for a small
+                              num of features.
+                          'lbfgs' - L-BFGS of scipy, for many features.
+            tol (float): 'newton' and 'lbfgs' stop when the gradient norm
+                is below tol (default 1e-6). 'gd' stops early when the loss
+                didn't improve by more than tol for patience epochs (see
+                minibatch_descent), None - run all the epochs.
+            patience (int): Num of epochs without improvement to stop 'gd'.
+            validation_fraction (float): Fraction of the samples held out
+                to decide the early stopping of 'gd' by their loss.
+            self.iterations is the num of iterations (epochs). The losses of
+            the GD epochs are recorded in self.loss_history (and
+            self.validation_history).
         """
-        if self.normalize:  # Normalize the matrix
-            dm_X = self.design_matrix(self.normalize_matrix(X, True))
-        else:
-            dm_X = self.design_matrix(X)
+        y = np.asarray(y, dtype=self.dtype)
+        dm_X = model_design_matrix(self, X, True)
+        self.fit_matrix(dm_X, y, epochs, learn_rate, batch_size, shuffle, optimizer, solver, tol,
+                        patience, validation_fraction)
+
+    def fit_matrix(self, dm_X, y, epochs=None, learn_rate=None, batch_size=None, shuffle=True,
+                   optimizer='sgd', solver='gd', tol=None, patience=5, validation_fraction=None):
+        """Training the model by the design-matrix dm_X (see fit)"""
+        if solver == 'newton':
+            self.newton(dm_X, y, epochs or 100, 1e-6 if tol is None else tol)
+        elif solver == 'lbfgs':
+            self.lbfgs(dm_X, y, epochs or 100, 1e-6 if tol is None else tol)
+        elif solver != 'gd':
+            raise ValueError(f"Unknown solver '{solver}'.")
 
         # 'Gradient Descent' method
-        if learn_rate and epochs:
-            for _ in range(epochs):  # Calculate the new weights by vectorization approach
-                self.weights -= (learn_rate /
-                                 y.shape[0]) * dm_X.T @ (self.sigmoid_fn(dm_X @ self.weights) - y)
+        elif learn_rate and epochs:
+            descent_fit(self, dm_X, y, epochs, learn_rate, batch_size, shuffle, optimizer, tol,
+                        patience, validation_fraction)
+
+    def fit_path(self, X, y, alphas, epochs=None, learn_rate=None, solver='lbfgs', tol=None):
+        """
+        Train the model for every L2 penalty of alphas (see fit for the
+        other arguments), every one warm started from the solution of the
+        previous, so give the alphas from the largest down.
+        Returns the weights of every alpha (len(alphas) x input_features+1 x
+        1) and the num of iterations of every alpha. The model is left with
+        the last alpha.
+        """
+        y = np.asarray(y, dtype=self.dtype)
+        dm_X = model_design_matrix(self, X, True)
+        path, iterations = [], []
+        for alpha in alphas:
+            self.alpha = alpha
+            self.fit_matrix(dm_X, y, epochs, learn_rate, solver=solver, tol=tol)
+            path.append(self.weights.copy())
+            iterations.append(self.iterations)
+        return np.stack(path), iterations
+
+    def newton(self, dm_X, y, max_iter=100, tol=1e-6):
+        """
+        Newton's method (IRLS) on the cross entropy loss: every iteration
+        solves the Hessian dm_X^T S dm_X / N, where S is the diagonal of
+        p(1-p), with the gradient. Converges in a few iterations, but costs
+        O(features^3) per iteration.
+        """
+        if not isinstance(dm_X, np.ndarray):
+            raise ValueError("The 'newton' solver needs a dense dataset, use 'lbfgs' or 'gd'.")
+        self.iterations = 0
+        while self.iterations < max_iter:
+            prob = self.sigmoid_fn(dm_X @ self.weights)
+            gradient = dm_X.T @ (prob - y) / y.shape[0]
+            l2_penalty(self.weights, self.alpha, gradient)
+            if np.linalg.norm(gradient) < tol:
+                break
+            hessian = dm_X.T @ (dm_X * (prob * (1 - prob))) / y.shape[0]
+            hessian[1:, 1:] += self.alpha * np.eye(hessian.shape[0] - 1)
+            try:
+                step = cho_solve(cho_factor(hessian), gradient)
+            except LinAlgError:
+                step = np.linalg.lstsq(hessian, gradient, rcond=None)[0]
+            self.weights -= step.astype(self.dtype)
+            self.iterations += 1
+
+    def lbfgs(self, dm_X, y, max_iter=100, tol=1e-6):
+        """L-BFGS (scipy.optimize) on the cross entropy loss"""
+        lbfgs_fit(self, dm_X, y, max_iter, tol)
+
+    def loss_gradient(self, dm_X, y, residual=None, out=None):
+        """
+        The cross entropy loss (with the L2 penalty) and its gradient by the
+        weights for the design-matrix dm_X. residual (N x 1) and out (the
+        gradient) are optional work buffers.
+        """
+        residual = matmul(dm_X, self.weights, out=residual)
+        loss, _ = self.cross_entropy_kernel(residual, y, out=residual)
+        out = matmul(dm_X.T, residual, out=out)
+        out /= y.shape[0]
+        return loss / y.shape[0] + l2_penalty(self.weights, self.alpha, out), out
 
     def loss(self, y_prediction, y_true):
         """ Cross entropy loss i.e. logistic loss."""
+        # Probabilities of exactly 0 or 1 would give log(0)
+        eps = np.finfo(np.result_type(y_prediction, np.float32)).eps
+        y_prediction = np.clip(y_prediction, eps, 1 - eps)
         return -np.mean(y_true * np.log(y_prediction) + (1-y_true) * np.log(1-y_prediction))
+
+
+class SoftmaxRegressionModel(LinearModel):
+    """
+    A model for Softmax (multinomial logistic) Regression i.e. classification
+    of n_classes classes, all trained together.
+    Arguments:
+        input_features (int)
+        n_classes (int)
+        normalize (bool)
+        dtype (np.dtype): Floating type of the weights and the computations.
+        alpha (float): L2 penalty, the loss is the cross entropy +
+            alpha/2 ||W||^2 (the bias excluded, of the normalized features
+            if normalize).
+    """
+
+    def __init__(self, input_features, n_classes, normalize=False, dtype=np.float64,
+                 alpha=0.0):
+        super().__init__(input_features, n_classes, normalize, dtype, alpha)
+        self.n_classes = n_classes
+
+    def one_hot(self, y):
+        """
+        Take the labels y (N or N x 1 of 0 .. n_classes-1) and return their
+        one-hot matrix (N x n_classes). A y of N x n_classes is taken as the
+        one-hot (or probabilities) matrix itself.
+        """
+        y = np.asarray(y)
+        if y.ndim == 2 and y.shape[1] == self.n_classes > 1:
+            return y.astype(self.dtype, copy=False)
+        labels = y.reshape(-1).astype(np.intp)
+        if labels.size and (labels.min() < 0 or labels.max() >= self.n_classes):
+            raise ValueError(f'The labels must be in the range [0, {self.n_classes}).')
+        Y = np.zeros((labels.shape[0], self.n_classes), dtype=self.dtype)
+        Y[np.arange(labels.shape[0]), labels] = 1
+        return Y
+
+    def targets(self, y):
+        """The one-hot matrix of the labels y (see one_hot)"""
+        return self.one_hot(y)
+
+    @staticmethod
+    def softmax_fn(Z, out=None):
+        """Calculate the Softmax-function of every row of Z (numerically stable)"""
+        out = np.subtract(Z, Z.max(axis=1, keepdims=True), out=out)
+        np.exp(out, out=out)
+        out /= out.sum(axis=1, keepdims=True)
+        return out
+
+    @staticmethod
+    def cross_entropy_kernel(Z, Y, out=None):
+        """
+        Fused and numerically stable cross entropy of the logits Z (N x C)
+        with the one-hot Y: writes the gradient by Z, softmax(Z) - Y, to out
+        and returns (sum of the losses, out). The loss of every sample is
+        log(sum(e^z)) - y.z, where log(sum(e^z)) is computed as
+        max(z) + log(sum(e^(z - max(z)))). out may be Z itself.
+        """
+        y_z = np.vdot(Y, Z)
+        max_z = Z.max(axis=1, keepdims=True)
+        out = np.subtract(Z, max_z, out=out)
+        np.exp(out, out=out)
+        sums = out.sum(axis=1, keepdims=True)
+        loss = max_z.sum() + np.log(sums).sum() - y_z
+        out /= sums
+        out -= Y
+        return loss, out
+
+    def freeze(self):
+        """
+        Return a LinearPredictor of the probability matrix by the current
+        weights, with the normalization folded into them, to predict from
+        the raw X.
+        """
+        if self.normalize:
+            return LinearPredictor.fold(self.weights, self.mean, self.std, self.softmax_fn)
+        return LinearPredictor.fold(self.weights, link=self.softmax_fn)
+
+    def predict(self, X, prob=False, out=None, chunk_size=None):
+        """
+        Predict the output after training by given dataset X
+        Arguments:
+            X (np.ndarray): dataset.
+            prob (bool):
+                True - return the probability of every class (N x n_classes).
+                False - return the class of every case (N).
+            out (np.ndarray): Buffer of the probabilities (N x n_classes).
+            chunk_size (int): Num of rows to predict at once.
+        """
+        prob_matrix = self.freeze().predict(X, out, chunk_size)
+        return prob_matrix if prob else prob_matrix.argmax(axis=1)
+
+    def fit(self, X, y, epochs=None, learn_rate=None, batch_size=None, shuffle=True,
+            optimizer='sgd', solver='gd', tol=None, patience=5, validation_fraction=None):
+        """
+        Training the model by dataset X and the labels y.
+        Arguments:
+            X (np.ndarray): Dataset.
+            y (np.ndarray): Labels (see one_hot).
+            epochs (int): Num of iteration on GD function (max num of
+                iterations of 'lbfgs', default 100).
+            learn_rate (float): The rate of the learning of the model.
+            batch_size (int): Num of samples of every step (mini-batch SGD).
+                None - full batch gradient descent.
+            shuffle (bool): Go over the samples in a random order every epoch.
+            optimizer (str): 'sgd', 'momentum' or 'adam' (see Optimizer).
+            solver (str): 'gd' - gradient descent by learn_rate and epochs.
+                          'lbfgs' - L-BFGS of scipy.
+            tol (float): 'lbfgs' stops when the gradient norm is below tol
+                (default 1e-6). 'gd' stops early when the loss didn't
+                improve by more than tol for patience epochs (see
+                minibatch_descent), None - run all the epochs.
+            patience (int): Num of epochs without improvement to stop 'gd'.
+            validation_fraction (float): Fraction of the samples held out
+                to decide the early stopping of 'gd' by their loss.
+        """
+        Y = self.one_hot(y)
+        dm_X = model_design_matrix(self, X, True)
+
+        if solver == 'lbfgs':
+            lbfgs_fit(self, dm_X, Y, epochs or 100, 1e-6 if tol is None else tol)
+        elif solver != 'gd':
+            raise ValueError(f"Unknown solver '{solver}'.")
+
+        # 'Gradient Descent' method
+        elif learn_rate and epochs:
+            descent_fit(self, dm_X, Y, epochs, learn_rate, batch_size, shuffle, optimizer, tol,
+                        patience, validation_fraction)
+
+    def loss_gradient(self, dm_X, Y, residual=None, out=None):
+        """
+        The cross entropy loss (with the L2 penalty) and its gradient by the
+        weights for the design-matrix dm_X and the one-hot Y. residual (N x n_classes) and
+        out (the gradient) are optional work buffers.
+        """
+        residual = matmul(dm_X, self.weights, out=residual)
+        loss, _ = self.cross_entropy_kernel(residual, Y, out=residual)
+        out = matmul(dm_X.T, residual, out=out)
+        out /= Y.shape[0]
+        return loss / Y.shape[0] + l2_penalty(self.weights, self.alpha, out), out
+
+    def loss(self, y_prediction, y_true):
+        """
+        Cross entropy loss of the probability matrix y_prediction and the
+        labels y_true.
+        """
+        # Probabilities of exactly 0 would give log(0)
+        eps = np.finfo(np.result_type(y_prediction, np.float32)).eps
+        y_prediction = np.clip(y_prediction, eps, 1)
+        return -np.mean(np.sum(self.one_hot(y_true) * np.log(y_prediction), axis=1))
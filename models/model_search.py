@@ -0,0 +1,124 @@
+from .linear_model import LinearRegressionModel
+from .shared_arrays import share_arrays, shared_run
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+import inspect
+import os
+import numpy as np
+
+
+def parameter_grid(grid):
+    """
+    All the configurations of a grid: a dict of {name: list of values}.
+    Returns a list of dicts of {name: value}.
+    """
+    names = list(grid)
+    return [dict(zip(names, values)) for values in product(*grid.values())]
+
+
+def parameter_samples(distributions, n_samples, random_state=None):
+    """
+    n_samples random configurations of distributions: a dict of {name: list
+    of values (drawn uniformly) or function of a np.random.Generator (e.g.
+    lambda rng: 10 ** rng.uniform(-3, 0))}.
+    Returns a list of dicts of {name: value}.
+    """
+    rng = np.random.default_rng(random_state)
+    configs = []
+    for _ in range(n_samples):
+        configs.append({name: values(rng) if callable(values) else values[rng.integers(len(values))]
+                        for name, values in distributions.items()})
+    return configs
+
+
+def kfold_indices(n_samples, n_folds=5, random_state=None):
+    """
+    Split the samples randomly to n_folds folds.
+    Returns a list of (training indices, validation indices) of every fold.
+    """
+    if not 2 <= n_folds <= n_samples:
+        raise ValueError(f'n_folds must be in the range [2, {n_samples}], got {n_folds}.')
+    order = np.random.default_rng(random_state).permutation(n_samples)
+    folds = np.array_split(order, n_folds)
+    return [(np.concatenate(folds[:i] + folds[i+1:]), fold) for i, fold in enumerate(folds)]
+
+
+def split_config(model_class, config):
+    """Split a configuration to (arguments of model_class, arguments of its fit)"""
+    model_parameters = inspect.signature(model_class).parameters
+    model_kwargs = {name: value for name, value in config.items() if name in model_parameters}
+    fit_kwargs = {name: value for name, value in config.items() if name not in model_parameters}
+    return model_kwargs, fit_kwargs
+
+
+def validation_loss(model, X, Y):
+    """The loss of the trained model on the dataset X and the true values Y"""
+    if isinstance(model, LinearRegressionModel):
+        return model.loss(model.predict(X), Y)
+    return model.loss(model.predict(X, prob=True), Y)
+
+
+def fold_run(X, Y, model_class, model_args, config, train, validation, seed):
+    """
+    Train a model_class(*model_args) with the configuration (arguments of
+    the model and of its fit) on the training rows of X, Y and return its
+    loss on the validation rows. seed seeds the shuffling of the training.
+    """
+    model_kwargs, fit_kwargs = split_config(model_class, config)
+    model = model_class(*model_args, **model_kwargs)
+    # The models shuffle by np.random, whose state of the caller is restored
+    state = np.random.get_state()
+    try:
+        np.random.seed(seed)
+        model.fit(X[train], Y[train], **fit_kwargs)
+    finally:
+        np.random.set_state(state)
+    return validation_loss(model, X[validation], Y[validation])
+
+
+def search(model_class, model_args, X, Y, configs, n_folds=5, n_jobs=-1, random_state=None):
+    """
+    Cross validation of every configuration of configs (see parameter_grid
+    and parameter_samples) in a pool of n_jobs worker processes (1 - in this
+    process). A configuration holds arguments of model_class (e.g. alpha)
+    and of its fit (e.g. learn_rate, epochs), the rest of the arguments of
+    the model are model_args.
+    X and Y are copied once to shared memory instead of being pickled to
+    every worker.
+    Yields (index of the config, fold, validation loss) of every run as soon
+    as it completes.
+    """
+    X, Y = np.ascontiguousarray(X), np.ascontiguousarray(Y)
+    folds = kfold_indices(X.shape[0], n_folds, random_state)
+    runs = [(index, fold) for index in range(len(configs)) for fold in range(n_folds)]
+    seeds = np.random.SeedSequence(random_state).generate_state(len(runs))
+
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+    if n_jobs == 1:
+        for (index, fold), seed in zip(runs, seeds):
+            yield index, fold, fold_run(X, Y, model_class, model_args, configs[index],
+                                        *folds[fold], seed)
+        return
+
+    with share_arrays(X, Y) as shared, \
+            ProcessPoolExecutor(max_workers=min(n_jobs, len(runs))) as executor:
+        futures = {executor.submit(shared_run, fold_run, shared, model_class, model_args,
+                                   configs[index], *folds[fold], seed): (index, fold)
+                   for (index, fold), seed in zip(runs, seeds)}
+        for future in as_completed(futures):
+            yield (*futures[future], future.result())
+
+
+def select(model_class, model_args, X, Y, configs, n_folds=5, n_jobs=-1, random_state=None):
+    """
+    Cross validation of every configuration of configs (see search).
+    Returns (the configuration of the lowest mean validation loss, the mean
+    validation loss of every configuration).
+    """
+    losses = np.zeros((len(configs), n_folds))
+    for index, fold, loss in search(model_class, model_args, X, Y, configs, n_folds, n_jobs,
+                                    random_state):
+        losses[index, fold] = loss
+    mean_losses = losses.mean(axis=1)
+    return configs[int(np.nanargmin(mean_losses))], mean_losses
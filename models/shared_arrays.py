@@ -0,0 +1,54 @@
+from contextlib import contextmanager
+import numpy as np
+
+
+@contextmanager
+def share_arrays(*arrays):
+    """
+    Copy the arrays once to new shared memory blocks for worker processes.
+    Yields the (name, shape, dtype) of the block of every array (None for a
+    None array) for shared_run. The blocks are freed on exit.
+    """
+    # Python 3.8+, imported only by the parallel runs so serial use works on older versions
+    from multiprocessing import shared_memory
+    blocks, shared = [], []
+    try:
+        for array in arrays:
+            if array is None:
+                shared.append(None)
+                continue
+            array = np.ascontiguousarray(array)
+            blocks.append(shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1)))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=blocks[-1].buf)[:] = array
+            shared.append((blocks[-1].name, array.shape, array.dtype.str))
+        yield shared
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+
+def shared_run(function, shared, *args):
+    """
+    Return function(*arrays, *args) in a worker process, where the arrays
+    are read without a copy from the shared memory blocks of share_arrays
+    (shared - their (name, shape, dtype), None for a None array).
+    function must be picklable, i.e. defined at module level.
+    """
+    from multiprocessing import shared_memory
+    blocks, arrays = [], []
+    for block in shared:
+        if block is None:
+            arrays.append(None)
+            continue
+        name, shape, dtype = block
+        blocks.append(shared_memory.SharedMemory(name=name))
+        arrays.append(np.ndarray(shape, dtype=dtype, buffer=blocks[-1].buf))
+
+    try:
+        return function(*arrays, *args)
+    finally:
+        # The views must be released before the blocks are closed
+        del arrays
+        for shm in blocks:
+            shm.close()
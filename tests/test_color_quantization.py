@@ -0,0 +1,62 @@
+import pytest
+import numpy as np
+from PIL import Image
+from color_quantization import build_palette_lut, apply_palette, quantize_image
+from models.k_means import KMeans
+
+
+def test_exact_palette():
+    # With 8 bits the table maps every color to the palette color of its closest center
+    centers = np.random.rand(5, 1) * 255
+    img = np.random.randint(0, 256, (40, 30, 1)).astype(np.uint8)
+    lut = build_palette_lut(centers, 8)
+    assert lut.shape == (256, 1)
+
+    model = KMeans(5, 1)
+    model.cluster_centers = centers
+    labels = model.predict(img.reshape(-1, 1)).ravel()
+    palette = np.clip(np.rint(centers), 0, 255).astype(np.uint8)
+    assert (apply_palette(img, lut, 8) == palette[labels].reshape(img.shape)).all()
+
+
+@pytest.mark.parametrize("mode, shape", [('L', (50, 40)), ('RGB', (50, 40, 3))])
+def test_tiled_quantization(tmp_path, mode, shape):
+    img_path = str(tmp_path / 'image.png')
+    Image.fromarray(np.random.randint(0, 256, shape).astype(np.uint8), mode).save(img_path)
+
+    results = []
+    for tile_rows in (7, shape[0]):
+        results.append(np.array(Image.open(quantize_image(img_path, 4, 500, tile_rows, 0))))
+    assert results[0].shape == shape
+    assert (results[0] == results[1]).all()
+    assert len(np.unique(results[0].reshape(shape[0] * shape[1], -1), axis=0)) <= 4
+
+    if mode == 'L':
+        # Grayscale has an exact table: every pixel gets the closest palette color
+        pixels = np.array(Image.open(img_path)).astype(int)[..., None]
+        distances = abs(pixels - np.unique(results[0]))
+        assert (abs(pixels[..., 0] - results[0]) == distances.min(axis=-1)).all()
+
+
+@pytest.mark.parametrize("transparency", [None, 3])
+def test_palette_image(tmp_path, transparency):
+    # A palette (P) GIF is quantized by its colors, not by its palette indices
+    colors = np.array([[255, 0, 0], [0, 255, 0], [0, 0, 255], [0, 0, 0]], dtype=np.uint8)
+    indices = np.random.randint(0, 4, (30, 20)).astype(np.uint8)
+    image = Image.fromarray(indices, 'P')
+    image.putpalette(colors.ravel().tolist())
+    img_path = str(tmp_path / 'image.gif')
+    image.save(img_path, transparency=transparency)
+
+    new_image = Image.open(quantize_image(img_path, 4)).convert('RGB')
+    assert (np.array(new_image) == colors[indices]).all()
+
+
+def test_16_bit_image(tmp_path):
+    pixels = np.repeat([[1000, 30000, 60000]], 10, axis=0).astype(np.uint16)
+    img_path = str(tmp_path / 'image.png')
+    Image.fromarray(pixels).save(img_path)
+    assert Image.open(img_path).mode.startswith('I;16')
+
+    new_img = np.array(Image.open(quantize_image(img_path, 3)))
+    assert (new_img == (pixels >> 8)).all()
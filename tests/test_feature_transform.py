@@ -0,0 +1,52 @@
+import pytest
+import numpy as np
+from datetime import datetime
+from models.feature_transform import PolynomialFeatures, FeaturePipeline, dates_to_years
+from models.linear_model import LinearRegressionModel
+from sklearn.preprocessing import PolynomialFeatures as SKPolynomialFeatures
+
+BATCH_SIZE = 1000
+ACCEPTABLE_NUMERIC_ERROR = 1e-6
+
+
+@pytest.mark.parametrize("degree, interaction_only", [(1, False), (2, False), (3, False),
+                                                      (3, True)])
+def test_polynomial_features(degree, interaction_only):
+    X = np.random.rand(BATCH_SIZE, 4)
+    transform = PolynomialFeatures(degree, interaction_only)
+    sk_transform = SKPolynomialFeatures(degree, interaction_only=interaction_only,
+                                        include_bias=False)
+    X_poly = transform.transform(X)
+    assert X_poly.shape == (BATCH_SIZE, transform.n_output_features(4))
+    assert abs(X_poly - sk_transform.fit_transform(X)).max() < 1e-12
+
+    out = np.empty_like(X_poly)
+    assert transform.transform(X, out) is out
+    assert (out == X_poly).all()
+
+    # Lists and integer features
+    X_list = np.random.randint(0, 10, (BATCH_SIZE, 4))
+    assert (transform.transform(X_list.tolist()) == sk_transform.fit_transform(X_list)).all()
+
+    with pytest.raises(ValueError):
+        PolynomialFeatures(0)
+
+
+def test_dates_to_years():
+    dates = ['1965-01-31', '1999-12-01', '2020-05-17']
+    expected = []
+    for date in dates:
+        date = datetime.strptime(date, '%Y-%m-%d')
+        expected.append(date.year + (date.month - 1)/12)
+    assert (dates_to_years(dates) == expected).all()
+    assert (dates_to_years(np.array(dates, dtype='datetime64[D]')) == expected).all()
+
+
+def test_feature_pipeline():
+    x = np.random.rand(BATCH_SIZE) * 10 + 2000
+    Y = np.stack([x**2, 3 * x**3 - x], axis=1)
+    model = FeaturePipeline(PolynomialFeatures(3), LinearRegressionModel(3, 2, normalize=True))
+    model.fit(x, Y)
+    relative_error = abs(model.predict(x) - Y) / abs(Y)
+    assert relative_error.max() < ACCEPTABLE_NUMERIC_ERROR
+    assert model.loss(model.predict(x), Y) == model.model.loss(model.predict(x), Y)
@@ -1,12 +1,17 @@
 ﻿import pytest
+import sys
+import tracemalloc
 import numpy as np
-from models.k_means import KMeans
+from models.k_means import KMeans, iter_batches, unique_rows, sweep_clusters
 from sklearn.cluster import KMeans as SKKMeans
 
 
 ACCEPTABLE_ERROR = 1e-20
 N_ITER = 10
 N_INIT = 1
+# The parallel runs (n_jobs > 1) need multiprocessing.shared_memory
+requires_shared_memory = pytest.mark.skipif(sys.version_info < (3, 8),
+                                            reason="shared_memory is Python 3.8+")
 
 
 @pytest.mark.parametrize(
@@ -26,7 +31,8 @@ def test_k_means(n_clusters, n_samples, n_features):
     cluster_centers = np.random.rand(n_clusters, n_features)
 
     model = KMeans(n_clusters, n_features)
-    sk_model = SKKMeans(n_clusters, cluster_centers, N_INIT, N_ITER)
+    sk_model = SKKMeans(n_clusters=n_clusters, init=cluster_centers,
+                        n_init=N_INIT, max_iter=N_ITER)
 
     # Random dataset
     X = np.random.rand(n_samples, n_features)
@@ -50,3 +56,259 @@ def test_k_means(n_clusters, n_samples, n_features):
     for i in (centers - sk_centers):
         diff += np.linalg.norm(i)**2
     assert diff < ACCEPTABLE_ERROR
+
+
+def test_predict_brute_force():
+    model = KMeans(5, 3)
+    model.cluster_centers = np.random.rand(5, 3)
+    X = np.random.rand(500, 3)
+
+    # Compare the vectorized assignment with an explicit distance matrix
+    distances = ((X[:, None, :] - model.cluster_centers[None, :, :])**2).sum(axis=2)
+    labels = model.predict(X)
+    assert labels.shape == (500, 1)
+    assert np.array_equal(labels.ravel(), distances.argmin(axis=1))
+    assert abs(model.loss(X, labels) - distances.min(axis=1).sum()) < 1e-10
+
+
+def test_chunked_fit():
+    X = np.random.rand(1000, 3)
+    cluster_centers = np.random.rand(4, 3)
+    model = KMeans(4, 3)
+    chunked_model = KMeans(4, 3)
+
+    # Streaming the assignment over row blocks must not change the result
+    model.fit(X, N_ITER, N_INIT, cluster_centers)
+    chunked_model.fit(X, N_ITER, N_INIT, cluster_centers, chunk_size=64)
+    assert np.allclose(model.cluster_centers, chunked_model.cluster_centers)
+    assert np.array_equal(model.predict(X), chunked_model.predict(X, chunk_size=100))
+
+
+def test_partial_fit():
+    X = np.random.rand(1000, 2)
+    cluster_centers = np.random.rand(3, 2)
+
+    # From zero counts, one chunk is one Lloyd iteration
+    model = KMeans(3, 2)
+    model.cluster_centers = cluster_centers.copy()
+    model.counts = np.zeros(3)
+    model.partial_fit(X)
+    lloyd_model = KMeans(3, 2)
+    lloyd_model.k_means(X, 1, cluster_centers)
+    assert np.allclose(model.cluster_centers, lloyd_model.cluster_centers)
+
+    # Streaming over chunks counts every sample exactly once
+    model = KMeans(3, 2)
+    model.fit_stream(iter_batches(X, 128))
+    assert model.counts.sum() == X.shape[0]
+
+
+@pytest.mark.parametrize("init", ['random', 'k-means++', 'greedy-k-means++'])
+def test_init_centers(init):
+    X = np.random.rand(300, 2)
+    X[100:200] += 10
+    X[200:] -= 10
+    model = KMeans(3, 2)
+    centers = model.init_centers(X, init)
+
+    # The seeds are distinct samples of X
+    assert centers.shape == (3, 2)
+    assert len(np.unique(centers, axis=0)) == 3
+    assert all((X == center).all(axis=1).any() for center in centers)
+
+    # k-means++ spreads the seeds over the three far away groups
+    if init != 'random':
+        model.cluster_centers = centers
+        assert len(np.unique(model.predict(X))) == 3
+
+
+def test_early_stopping():
+    X = np.random.rand(1000, 2)
+    cluster_centers = np.random.rand(4, 2)
+    model = KMeans(4, 2)
+
+    # The run stops after convergence, with the loss of the final centers
+    model.fit(X, 1000, N_INIT, cluster_centers)
+    assert model.iterations < 1000
+    assert abs(model.inertia - model.loss(X, model.predict(X))) < 1e-8
+
+    # More iterations after convergence don't change anything
+    converged_centers = model.cluster_centers
+    model.fit(X, model.iterations + 10, N_INIT, cluster_centers)
+    assert np.array_equal(model.cluster_centers, converged_centers)
+
+
+@pytest.mark.parametrize("n_clusters", [1, 2, 16])
+def test_hamerly(n_clusters):
+    X = np.random.rand(2000, 3)
+    cluster_centers = X[:n_clusters]
+    model = KMeans(n_clusters, 3)
+    hamerly_model = KMeans(n_clusters, 3)
+
+    # Skipping distances by the bounds gives the same result as Lloyd
+    model.fit(X, 100, N_INIT, cluster_centers)
+    hamerly_model.fit(X, 100, N_INIT, cluster_centers, algorithm='hamerly')
+    assert np.allclose(model.cluster_centers, hamerly_model.cluster_centers)
+    assert model.iterations == hamerly_model.iterations
+    assert np.array_equal(model.predict(X), hamerly_model.predict(X))
+
+    # The same in chunks, without the full distance matrix
+    chunked_model = KMeans(n_clusters, 3)
+    chunked_model.fit(X, 100, N_INIT, cluster_centers, chunk_size=128, algorithm='hamerly')
+    assert np.allclose(model.cluster_centers, chunked_model.cluster_centers)
+    labels, closest, second = hamerly_model.two_closest(X)
+    tracemalloc.start()
+    chunked = hamerly_model.two_closest(X, chunk_size=128)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert np.array_equal(labels, chunked[0])
+    assert np.allclose(closest, chunked[1]) and np.allclose(second, chunked[2])
+    if n_clusters == 16:
+        # Less than the N x K distance matrix
+        assert peak < X.shape[0] * n_clusters * 8
+
+
+def test_hamerly_empty_clusters():
+    # Centers far outside the data leave clusters empty, which are reseeded
+    for seed in range(100):
+        rng = np.random.RandomState(seed)
+        X = rng.rand(50, 2)
+        cluster_centers = rng.rand(10, 2) * 4 - 1.5
+        model = KMeans(10, 2)
+        model.fit(X, 100, N_INIT, cluster_centers, history=True)
+        hamerly_model = KMeans(10, 2)
+        hamerly_model.fit(X, 100, N_INIT, cluster_centers, algorithm='hamerly')
+        assert model.history[0]['steps'][0]['empty_clusters'] > 0
+        assert np.allclose(model.cluster_centers, hamerly_model.cluster_centers)
+
+
+@requires_shared_memory
+def test_parallel_n_init():
+    X = np.random.rand(500, 2)
+    model = KMeans(5, 2)
+    parallel_model = KMeans(5, 2)
+
+    # Every run has its own seed, so the workers give the same result
+    model.fit(X, N_ITER, 4, random_state=0)
+    parallel_model.fit(X, N_ITER, 4, random_state=0, n_jobs=2)
+    assert np.array_equal(model.cluster_centers, parallel_model.cluster_centers)
+
+    # The best of the runs is kept
+    seeds = [int(seq.generate_state(1)[0]) for seq in np.random.SeedSequence(0).spawn(4)]
+    losses = [KMeans(5, 2).single_run(X, seed, N_ITER)[0] for seed in seeds]
+    assert model.inertia == min(losses)
+    assert abs(model.inertia - model.loss(X, model.predict(X))) < 1e-8
+
+    # The runs draw from their own RandomState, not from np.random
+    state = np.random.get_state()
+    expected = np.random.rand()
+    np.random.set_state(state)
+    model.fit(X, N_ITER, 2, random_state=1, init='random')
+    assert np.random.rand() == expected
+
+
+def test_sample_weight():
+    X = np.random.rand(300, 2)
+    weights = np.random.randint(1, 4, 300)
+    cluster_centers = X[:3]
+    model = KMeans(3, 2)
+    weighted_model = KMeans(3, 2)
+
+    # Integer weights are the same as repeating the samples
+    model.fit(np.repeat(X, weights, axis=0), 50, N_INIT, cluster_centers)
+    weighted_model.fit(X, 50, N_INIT, cluster_centers, sample_weight=weights)
+    assert np.allclose(model.cluster_centers, weighted_model.cluster_centers)
+    assert abs(model.inertia - weighted_model.inertia) < 1e-8
+
+
+def test_collapse_duplicates():
+    palette = np.random.randint(0, 256, (50, 3)).astype(np.uint8)
+    X = palette[np.random.randint(0, 50, 5000)]
+    unique, counts = unique_rows(X)
+    np_unique, np_counts = np.unique(X, axis=0, return_counts=True)
+    assert np.array_equal(unique, np_unique)
+    assert np.array_equal(counts, np_counts)
+
+    # Clustering the unique colors has the same loss function
+    cluster_centers = palette[:4].astype(float)
+    model = KMeans(4, 3)
+    collapsed_model = KMeans(4, 3)
+    model.fit(X, 50, N_INIT, cluster_centers)
+    collapsed_model.fit(X, 50, N_INIT, cluster_centers, collapse_duplicates=True)
+    assert np.allclose(model.cluster_centers, collapsed_model.cluster_centers)
+    assert abs(model.inertia - collapsed_model.inertia) < 1e-6 * model.inertia
+
+
+def test_float32():
+    X = np.random.randint(0, 256, (1000, 3)).astype(np.uint8)
+    cluster_centers = X[:4].astype(float)
+    model = KMeans(4, 3, dtype=np.float32)
+    model64 = KMeans(4, 3)
+
+    # The whole fit stays in float32 and the result matches float64
+    model.fit(X, N_ITER, N_INIT, cluster_centers)
+    model64.fit(X, N_ITER, N_INIT, cluster_centers)
+    assert model.cluster_centers.dtype == np.float32
+    assert np.allclose(model.cluster_centers, model64.cluster_centers, atol=1e-2)
+
+
+def test_index():
+    X = np.random.rand(2000, 3)
+    model = KMeans(64, 3)
+    model.fit(X, N_ITER, N_INIT, build_index=True)
+    assert model.index is not None
+
+    # The KD-tree finds the same closest centers as the brute force scan
+    labels = model.predict(X, chunk_size=500)
+    model.index = None
+    assert np.array_equal(labels, model.predict(X))
+
+    # Training again drops the index of the old centers
+    model.build_index()
+    model.partial_fit(X[:100])
+    assert model.index is None
+
+
+@requires_shared_memory
+def test_index_parallel_refit():
+    # The refit drops the index also when its runs are in worker processes
+    X = np.random.rand(2000, 3)
+    model = KMeans(64, 3)
+    model.fit(X, N_ITER, N_INIT, build_index=True)
+    model.fit(X, N_ITER, 2, n_jobs=2)
+    assert model.index is None
+    labels, _ = model.assign(X)
+    assert np.array_equal(model.predict(X).ravel(), labels)
+
+
+def test_sweep_clusters():
+    X = np.concatenate([center + np.random.rand(100, 2) for center in range(0, 40, 10)])
+    inertias, centers = sweep_clusters(X, [1, 2, 4, 6], 100)
+    assert inertias.shape == (4,)
+    assert [len(c) for c in centers] == [1, 2, 4, 6]
+
+    # The loss drops sharply until the 4 true clusters (elbow) and then slowly
+    assert np.all(np.diff(inertias) < 0)
+    assert inertias[2] < 0.01 * inertias[1]
+    assert abs(inertias[2] - sum(np.var(X[i:i+100], axis=0).sum() * 100
+                                 for i in range(0, 400, 100))) < 1e-6
+
+    for n_clusters_range in ([], [2, 1], [0, 2]):
+        with pytest.raises(ValueError):
+            sweep_clusters(X, n_clusters_range, 100)
+
+
+def test_history():
+    X = np.random.rand(500, 2)
+    model = KMeans(4, 2)
+    model.fit(X, 100, 3, history=True)
+    assert len(model.history) == 3
+    assert sum(run['chosen'] for run in model.history) == 1
+
+    # The chosen run is the best one and its steps never increase the loss
+    chosen = next(run for run in model.history if run['chosen'])
+    assert chosen['inertia'] == model.inertia == min(run['inertia'] for run in model.history)
+    assert len(chosen['steps']) >= chosen['iterations']
+    losses = [step['inertia'] for step in chosen['steps']]
+    assert all(b <= a + 1e-9 for a, b in zip(losses, losses[1:]))
+    assert chosen['steps'][0]['label_changes'] == X.shape[0]
@@ -1,7 +1,11 @@
 import pytest
 import numpy as np
-from models.linear_model import LinearRegressionModel, LogisticRegressionModel
+from scipy import sparse
+from models.linear_model import (LinearRegressionModel, LogisticRegressionModel,
+                                 SoftmaxRegressionModel)
 from sklearn.linear_model import LinearRegression as SKLinearRegression
+from sklearn.linear_model import Ridge as SKRidge
+from sklearn.linear_model import LogisticRegression as SKLogisticRegression
 from sklearn.metrics import mean_squared_error
 
 BATCH_SIZE = 1000
@@ -52,3 +56,253 @@ def test_linear_regression(input_shape, output_shape, epochs, learn_rate, accept
     assert model.loss(y_pred, y) < acceptable_loss
 
 
+def test_float32():
+    X = np.random.rand(BATCH_SIZE, 4).astype(np.float32)
+    y = X @ np.random.rand(4, 2) + np.random.rand(2)
+    model = LinearRegressionModel(4, 2, normalize=True, dtype=np.float32)
+    model.fit(X, y)
+    assert model.weights.dtype == np.float32
+    assert model.predict(X).dtype == np.float32
+    assert abs(model.predict(X) - y).max() < 1e-3
+
+    logistic_model = LogisticRegressionModel(4, normalize=True, dtype=np.float32)
+    logistic_model.fit(X, X[:, :1] > 0.5, 100, 0.5)
+    assert logistic_model.weights.dtype == np.float32
+    assert logistic_model.predict(X, prob=True).dtype == np.float32
+
+
+@pytest.mark.parametrize("normalize", [False, True])
+def test_fit_chunks(normalize):
+    X = np.random.rand(BATCH_SIZE, 8) * np.logspace(0, 3, 8)
+    y = X @ np.random.rand(8, 2) + np.random.rand(2) + np.random.normal(size=(BATCH_SIZE, 2))
+    model = LinearRegressionModel(8, 2, normalize)
+    chunked_model = LinearRegressionModel(8, 2, normalize)
+    model.fit(X, y)
+    chunked_model.fit_chunks((X[i:i+128], y[i:i+128]) for i in range(0, BATCH_SIZE, 128))
+
+    # One pass over the chunks gives the exact least squares solution
+    dm_X = np.c_[np.ones(BATCH_SIZE), X]
+    y_lstsq = dm_X @ np.linalg.lstsq(dm_X, y, rcond=None)[0]
+    assert abs(model.predict(X) - y_lstsq).max() < ACCEPTABLE_BASIC_ERROR
+    assert abs(chunked_model.predict(X) - y_lstsq).max() < ACCEPTABLE_BASIC_ERROR
+
+    with pytest.raises(ValueError):
+        chunked_model.fit_chunks(iter([]))
+
+
+@pytest.mark.parametrize("optimizer, learn_rate", [('sgd', 0.05), ('momentum', 0.01), ('adam', 0.01)])
+def test_minibatch(optimizer, learn_rate):
+    X = np.random.rand(BATCH_SIZE, 4)
+    y = X @ np.random.rand(4, 1) + np.random.rand(1)
+    model = LinearRegressionModel(4, 1, normalize=True)
+    model.fit(X, y, 100, learn_rate, batch_size=32, optimizer=optimizer)
+    assert model.loss(model.predict(X), y) < 1e-3
+
+    # Streaming batches to partial_fit
+    logistic_model = LogisticRegressionModel(4, normalize=True)
+    labels = (X[:, :1] + X[:, 1:2] > 1).astype(float)
+    for _ in range(20):
+        for i in range(0, BATCH_SIZE, 50):
+            logistic_model.partial_fit(X[i:i+50], labels[i:i+50], learn_rate * 10, optimizer)
+    assert (logistic_model.predict(X) == labels).mean() > 0.9
+
+
+def test_partial_fit_optimizer():
+    X = np.random.rand(BATCH_SIZE, 4)
+    y = X @ np.random.rand(4, 1)
+    model = LinearRegressionModel(4, 1)
+    model.fit(X, y, 10, 0.01, optimizer='adam')
+    fit_optimizer = model.optimizer
+
+    # partial_fit doesn't continue the optimizer of fit
+    weights = model.weights.copy()
+    _, gradient = model.loss_gradient(model.design_matrix(X), y)
+    model.partial_fit(X, y, 0.1)
+    assert np.allclose(model.weights, weights - 0.1 * gradient)
+    assert model.optimizer is fit_optimizer and fit_optimizer.method == 'adam'
+
+    # A new learn_rate or optimizer restarts the state of partial_fit
+    partial_optimizer = model.partial_optimizer
+    model.partial_fit(X, y, 0.1)
+    assert model.partial_optimizer is partial_optimizer
+    model.partial_fit(X, y, 0.05)
+    assert model.partial_optimizer.learn_rate == 0.05
+    model.partial_fit(X, y, 0.05, 'momentum')
+    assert model.partial_optimizer.method == 'momentum'
+    assert model.partial_optimizer.steps == 1
+
+
+@pytest.mark.parametrize("solver", ['newton', 'lbfgs'])
+def test_logistic_solvers(solver):
+    X = np.random.rand(BATCH_SIZE, 3)
+    y = (X @ np.random.rand(3, 1) + np.random.normal(size=(BATCH_SIZE, 1)) * 0.3 > 0.8)
+    gd_model = LogisticRegressionModel(3, normalize=True)
+    gd_model.fit(X, y, 20000, 1.0)
+    model = LogisticRegressionModel(3, normalize=True)
+    model.fit(X, y, solver=solver, tol=1e-8)
+
+    # The same optimum in tens of iterations
+    assert model.iterations < 50
+    assert abs(model.weights - gd_model.weights).max() < 1e-2
+
+
+def test_logistic_stability():
+    # Separable data drives |z| far beyond the range of np.exp
+    X = np.concatenate([np.full((10, 1), -1.0), np.full((10, 1), 1.0)])
+    y = (X > 0).astype(float)
+    model = LogisticRegressionModel(1)
+    model.weights = np.array([[0.0], [1000.0]])
+    with np.errstate(over='raise', divide='raise', invalid='raise'):
+        probabilities = model.predict(X, prob=True)
+        assert np.isfinite(model.loss(probabilities, y))
+        model.fit(X, y, 10, 1.0, batch_size=8)
+    assert np.isfinite(model.weights).all()
+    assert (model.predict(X) == y).all()
+
+    z = np.array([-1000.0, 0.0, 1000.0])
+    loss, residual = LogisticRegressionModel.cross_entropy_kernel(z, np.array([1.0, 1.0, 0.0]))
+    assert np.isclose(loss, 2000 + np.log(2))
+    assert np.allclose(residual, [-1.0, -0.5, 1.0])
+
+
+@pytest.mark.parametrize("validation_fraction", [None, 0.2])
+def test_early_stopping(validation_fraction):
+    X = np.random.rand(BATCH_SIZE, 3)
+    y = (X @ np.random.rand(3, 1) + np.random.normal(size=(BATCH_SIZE, 1)) * 0.3 > 0.8)
+    full_model = LogisticRegressionModel(3, normalize=True)
+    full_model.fit(X, y, 5000, 1.0)
+    assert full_model.iterations == len(full_model.loss_history) == 5000
+
+    model = LogisticRegressionModel(3, normalize=True)
+    model.fit(X, y, 5000, 1.0, tol=1e-6, validation_fraction=validation_fraction)
+    assert model.iterations < 1000
+    full_loss = full_model.loss(full_model.predict(X, True), y)
+    assert model.loss(model.predict(X, True), y) < full_loss + 1e-2
+    assert len(model.validation_history) == (model.iterations if validation_fraction else 0)
+    # Full batch GD never increases the loss with a small enough learn_rate
+    assert (np.diff(model.loss_history) <= 1e-12).all()
+
+    linear_model = LinearRegressionModel(3, 1)
+    linear_model.fit(X, X @ np.ones((3, 1)), 1000, 0.1, batch_size=100, tol=1e-8, patience=3)
+    assert linear_model.iterations < 1000
+    assert linear_model.loss_history[-1] < 1e-4
+
+    with pytest.raises(ValueError):
+        model.fit(X, y, 10, 1.0, validation_fraction=1.0)
+
+
+def test_freeze():
+    X = np.random.rand(BATCH_SIZE, 4) * 10 + 5
+    Y = X @ np.random.rand(4, 2) + np.random.rand(2)
+    model = LinearRegressionModel(4, 2, normalize=True)
+    model.fit(X, Y)
+    design_matrix = model.design_matrix(model.normalize_matrix(X, False))
+    out = np.empty((BATCH_SIZE, 2))
+    predictor = model.freeze()
+    assert predictor.predict(X, out, chunk_size=64) is out
+    assert abs(out - design_matrix @ model.weights).max() < ACCEPTABLE_NUMERIC_ERROR
+
+    labels = (X[:, :1] > 10).astype(float)
+    logistic_model = LogisticRegressionModel(4, normalize=True)
+    logistic_model.fit(X, labels, solver='newton')
+    probabilities = logistic_model.sigmoid_fn(
+        logistic_model.design_matrix(logistic_model.normalize_matrix(X, False))
+        @ logistic_model.weights)
+    assert abs(logistic_model.predict(X, True, chunk_size=100) - probabilities).max() < 1e-10
+    assert (logistic_model.predict(X) == np.round(probabilities)).all()
+
+
+@pytest.mark.parametrize("normalize", [False, True])
+def test_sparse(normalize):
+    X_sparse = sparse.random(BATCH_SIZE, 20, density=0.1, format='csr', random_state=0)
+    X = X_sparse.toarray()
+    Y = X @ np.random.rand(20, 2) + np.random.rand(2)
+    y = (X @ np.random.normal(size=(20, 1)) + np.random.normal(size=(BATCH_SIZE, 1)) * 0.1 > 0)
+
+    model, sparse_model = (LinearRegressionModel(20, 2, normalize) for _ in range(2))
+    model.fit(X, Y)
+    sparse_model.fit(X_sparse, Y)
+    assert abs(model.weights - sparse_model.weights).max() < ACCEPTABLE_BASIC_ERROR
+    assert abs(model.predict(X) - sparse_model.predict(X_sparse)).max() < ACCEPTABLE_BASIC_ERROR
+
+    for solver, batch_size in [('gd', 100), ('lbfgs', None)]:
+        model, sparse_model = (LogisticRegressionModel(20, normalize) for _ in range(2))
+        np.random.seed(0)
+        model.fit(X, y, 20, 1.0, batch_size=batch_size, solver=solver)
+        np.random.seed(0)
+        sparse_model.fit(X_sparse, y, 20, 1.0, batch_size=batch_size, solver=solver)
+        assert abs(model.weights - sparse_model.weights).max() < ACCEPTABLE_NUMERIC_ERROR
+        assert (model.predict(X) == sparse_model.predict(X_sparse, chunk_size=64)).all()
+
+    with pytest.raises(ValueError):
+        sparse_model.fit(X_sparse, y, solver='newton')
+
+
+@pytest.mark.parametrize("solver, epochs, learn_rate", [('lbfgs', 500, None), ('gd', 2000, 1.0)])
+def test_softmax(solver, epochs, learn_rate):
+    X = np.random.normal(size=(BATCH_SIZE, 5))
+    y = (X @ np.random.normal(size=(5, 3)) + np.random.normal(size=(BATCH_SIZE, 3))).argmax(axis=1)
+    model = SoftmaxRegressionModel(5, 3, normalize=True)
+    model.fit(X, y, epochs, learn_rate, solver=solver)
+    sk_model = SKLogisticRegression(C=np.inf, tol=1e-10, max_iter=1000).fit(X, y)
+
+    probabilities = model.predict(X, prob=True)
+    assert probabilities.shape == (BATCH_SIZE, 3)
+    assert abs(probabilities - sk_model.predict_proba(X)).max() < 1e-2
+    assert (model.predict(X) == sk_model.predict(X)).mean() > 0.99
+    assert abs(model.loss(probabilities, y) - model.loss(sk_model.predict_proba(X), y)) < 1e-4
+
+    # No overflow for large logits
+    loss, residual = SoftmaxRegressionModel.cross_entropy_kernel(
+        np.array([[1000.0, 0.0, -1000.0]]), np.array([[0.0, 0.0, 1.0]]))
+    assert np.isclose(loss, 2000)
+    assert np.allclose(residual, [[1.0, 0.0, -1.0]])
+
+
+@pytest.mark.parametrize("normalize", [False, True])
+def test_ridge_path(normalize):
+    X = np.random.rand(BATCH_SIZE, 6) * np.arange(1, 7)
+    Y = X @ np.random.rand(6, 2) + np.random.normal(size=(BATCH_SIZE, 2))
+    alphas = np.logspace(1, -4, 20)
+    model = LinearRegressionModel(6, 2, normalize)
+    path = model.fit_path(X, Y, alphas)
+    assert path.shape == (20, 7, 2)
+    assert model.alpha == alphas[-1]
+    for alpha, weights in zip(alphas[::5], path[::5]):
+        ridge_model = LinearRegressionModel(6, 2, normalize, alpha=alpha)
+        ridge_model.fit(X, Y)
+        assert abs(ridge_model.weights - weights).max() < ACCEPTABLE_NUMERIC_ERROR
+
+    # The same penalty by gradient descent
+    gd_model = LinearRegressionModel(6, 2, True, alpha=0.1)
+    gd_model.fit(X, Y, 2000, 0.5)
+    ridge_model = LinearRegressionModel(6, 2, True, alpha=0.1)
+    ridge_model.fit(X, Y)
+    assert abs(gd_model.weights - ridge_model.weights).max() < ACCEPTABLE_NUMERIC_ERROR
+
+    if not normalize:
+        # alpha of the mean loss is alpha * N of the summed loss of sklearn
+        sk_model = SKRidge(alpha=alphas[3] * BATCH_SIZE).fit(X, Y)
+        assert abs(sk_model.coef_.T - path[3][1:]).max() < ACCEPTABLE_NUMERIC_ERROR
+        assert abs(sk_model.intercept_ - path[3][0]).max() < ACCEPTABLE_NUMERIC_ERROR
+
+
+def test_logistic_path():
+    X = np.random.rand(BATCH_SIZE, 5)
+    y = (X @ np.random.rand(5, 1) + np.random.normal(size=(BATCH_SIZE, 1)) * 0.3 > 1.2)
+    alphas = np.logspace(0, -4, 10)
+    model = LogisticRegressionModel(5, normalize=True)
+    path, iterations = model.fit_path(X, y, alphas, tol=1e-8)
+    assert path.shape == (10, 6, 1)
+    # Stronger penalties give smaller weights
+    assert (np.diff(np.linalg.norm(path[:, 1:, 0], axis=1)) > 0).all()
+
+    cold_iterations = 0
+    for alpha, weights in zip(alphas, path):
+        cold_model = LogisticRegressionModel(5, normalize=True, alpha=alpha)
+        cold_model.fit(X, y, solver='newton', tol=1e-10)
+        assert abs(cold_model.weights - weights).max() < 1e-4
+        cold_model = LogisticRegressionModel(5, normalize=True, alpha=alpha)
+        cold_model.fit(X, y, solver='lbfgs', tol=1e-8)
+        cold_iterations += cold_model.iterations
+    assert sum(iterations) < cold_iterations
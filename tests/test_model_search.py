@@ -0,0 +1,69 @@
+import pytest
+import sys
+import numpy as np
+from models.linear_model import LinearRegressionModel, LogisticRegressionModel
+from models.model_search import parameter_grid, parameter_samples, kfold_indices, search, select
+
+BATCH_SIZE = 500
+
+
+def test_configs():
+    grid = parameter_grid({'learn_rate': [0.01, 0.1], 'epochs': [10, 100, 1000]})
+    assert len(grid) == 6
+    assert {'learn_rate': 0.1, 'epochs': 1000} in grid
+
+    samples = parameter_samples({'learn_rate': lambda rng: 10 ** rng.uniform(-3, 0),
+                                 'optimizer': ['sgd', 'adam']}, 20, random_state=0)
+    assert len(samples) == 20
+    assert all(1e-3 <= config['learn_rate'] <= 1 for config in samples)
+    assert {config['optimizer'] for config in samples} == {'sgd', 'adam'}
+    assert samples == parameter_samples({'learn_rate': lambda rng: 10 ** rng.uniform(-3, 0),
+                                         'optimizer': ['sgd', 'adam']}, 20, random_state=0)
+
+
+def test_kfold_indices():
+    folds = kfold_indices(103, 5, random_state=0)
+    assert len(folds) == 5
+    validation = np.concatenate([fold for _, fold in folds])
+    assert (np.sort(validation) == np.arange(103)).all()
+    for train, fold in folds:
+        assert len(train) + len(fold) == 103
+        assert not np.intersect1d(train, fold).size
+
+    with pytest.raises(ValueError):
+        kfold_indices(10, 1)
+
+
+# The pool (n_jobs > 1) needs multiprocessing.shared_memory
+@pytest.mark.parametrize("n_jobs", [1, pytest.param(2, marks=pytest.mark.skipif(
+    sys.version_info < (3, 8), reason="shared_memory is Python 3.8+"))])
+def test_search(n_jobs):
+    X = np.random.rand(BATCH_SIZE, 3)
+    Y = X @ np.random.rand(3, 1) + np.random.normal(size=(BATCH_SIZE, 1)) * 0.01
+    configs = parameter_grid({'learn_rate': [1e-4, 0.5], 'epochs': [100], 'alpha': [0, 10]})
+    results = list(search(LinearRegressionModel, (3, 1, True), X, Y, configs, n_folds=3,
+                          n_jobs=n_jobs, random_state=0))
+    assert sorted((index, fold) for index, fold, _ in results) == \
+        [(index, fold) for index in range(4) for fold in range(3)]
+
+    best, losses = select(LinearRegressionModel, (3, 1, True), X, Y, configs, n_folds=3,
+                          n_jobs=n_jobs, random_state=0)
+    assert best == {'learn_rate': 0.5, 'epochs': 100, 'alpha': 0}
+    assert losses.shape == (4,)
+    assert losses.min() < 1e-3
+
+    # The same runs in the pool and in the process, which keeps its np.random state
+    state = np.random.get_state()
+    expected = np.random.rand()
+    np.random.set_state(state)
+    serial_best, serial_losses = select(LinearRegressionModel, (3, 1, True), X, Y, configs,
+                                        n_folds=3, n_jobs=1, random_state=0)
+    assert np.random.rand() == expected
+    assert serial_best == best
+    assert np.allclose(serial_losses, losses)
+
+    labels = (X[:, :1] > 0.5).astype(float)
+    best, _ = select(LogisticRegressionModel, (3, True), X, labels,
+                     parameter_grid({'solver': ['lbfgs'], 'alpha': [1.0, 1e-4]}), n_folds=3,
+                     n_jobs=n_jobs)
+    assert best['alpha'] == 1e-4
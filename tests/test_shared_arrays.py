@@ -0,0 +1,23 @@
+import pytest
+import numpy as np
+from models.shared_arrays import share_arrays, shared_run
+
+# Python 3.8+
+shared_memory = pytest.importorskip('multiprocessing.shared_memory')
+
+
+def weighted_sum(X, weights, scale):
+    return (X.sum(axis=1) if weights is None else X @ weights) * scale
+
+
+def test_shared_run():
+    X = np.random.rand(20, 3)
+    weights = np.random.rand(3)
+    with share_arrays(X[:, ::-1], weights, None) as shared:
+        assert shared[2] is None
+        assert np.allclose(shared_run(weighted_sum, shared[:2], 2), X[:, ::-1] @ weights * 2)
+        assert np.allclose(shared_run(weighted_sum, [shared[0], None], 1), X.sum(axis=1))
+
+    # The blocks are freed on exit
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=shared[0][0])